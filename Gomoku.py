@@ -1,17 +1,411 @@
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+import argparse
+import json
 import random
+import threading
 import time
 import re 
 
-class Gomoku:
+# Kinds of score stored in the transposition table
+EXACT = 0
+LOWER = 1   # search failed high, real score >= stored score
+UPPER = 2   # search failed low, real score <= stored score
+
+# Stands for the winner before a move in move_history when that can no
+# longer be trusted (a stone played before it was taken back out of order)
+RESCAN = object()
+
+
+class SearchTimeout(Exception):
+    """Raised inside a search when its deadline (or node budget) has run out,
+    or it was told to stop."""
+
+
+class LazyTable(dict):
+    """A per-cell (or per-row) table whose entries are computed by make(key)
+    the first time they are looked up. The sparse board uses these instead
+    of lists covering the whole board."""
+
+    __slots__ = ('make',)
+
+    def __init__(self, make):
+        super().__init__()
+        self.make = make
+
+    def __missing__(self, key):
+        value = self[key] = self.make(key)
+        return value
+
+
+class SparseRow(dict):
+    """One row of a sparse board: only cells that ever held a stone are stored."""
+
+    __slots__ = ()
+
+    def __missing__(self, col):
+        return '.'
+
+
+class TranspositionTable:
+    """Bounded cache of search results keyed by Zobrist hash.
+
+    Each entry holds (depth, score, flag, best_move). The table never grows
+    past max_entries, derived from the memory cap. With policy 'depth' it is a
+    fixed array of slots where a new result only replaces a deeper one from
+    the current search; with policy 'lru' the least recently used entry is
+    evicted.
+    """
+
+    # rough size of one stored entry in CPython, including the dict/list slot
+    ENTRY_BYTES = 256
+
+    def __init__(self, max_mb=16, policy='depth', max_entries=None):
+        if policy not in ('depth', 'lru'):
+            raise ValueError(f"Unknown replacement policy: {policy}")
+        self.policy = policy
+        self.max_entries = max_entries or max(1, int(max_mb * 1024 * 1024) // self.ENTRY_BYTES)
+        self.generation = 0
+        self.clear()
+
+    def clear(self):
+        if self.policy == 'lru':
+            self.entries = OrderedDict()
+        else:
+            self.slots = [None] * self.max_entries
+        self.count = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def new_search(self):
+        # Entries from earlier searches may be overwritten regardless of depth
+        self.generation += 1
+
+    def lookup(self, key):
+        if self.policy == 'lru':
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+        else:
+            slot = self.slots[key % self.max_entries]
+            entry = slot[1] if slot is not None and slot[0] == key else None
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def peek(self, key):
+        # lookup() without touching the counters or the LRU order
+        if self.policy == 'lru':
+            return self.entries.get(key)
+        slot = self.slots[key % self.max_entries]
+        return slot[1] if slot is not None and slot[0] == key else None
+
+    def store(self, key, depth, score, flag, best_move):
+        entry = (depth, score, flag, best_move)
+        self.stores += 1
+        if self.policy == 'lru':
+            if key in self.entries:
+                self.entries.move_to_end(key)
+            else:
+                if self.count >= self.max_entries:
+                    self.entries.popitem(last=False)
+                    self.evictions += 1
+                else:
+                    self.count += 1
+            self.entries[key] = entry
+            return
+
+        index = key % self.max_entries
+        slot = self.slots[index]
+        if slot is None:
+            self.count += 1
+        elif slot[0] != key:
+            # depth-preferred: keep a deeper result from this search
+            if slot[2] == self.generation and slot[1][0] > depth:
+                return
+            self.evictions += 1
+        self.slots[index] = (key, entry, self.generation)
+
+    def stats(self):
+        probes = self.hits + self.misses
+        return {
+            'policy': self.policy,
+            'entries': self.count,
+            'capacity': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / probes if probes else 0.0,
+            'stores': self.stores,
+            'evictions': self.evictions,
+        }
+
+
+class SearchStats:
+    """What one get_ai_move call did: node counts, cutoffs, where the time
+    went and the principal variation. Filled in by the search as it runs."""
+
     def __init__(self):
-        self.size = 15
-        self.board = [['.' for _ in range(self.size)] for _ in range(self.size)]
-        self.ai_player1 = 'O'       #minimax
-        self.human_player = 'X'
-        self.ai_player2 = 'X'        #alpha beta
+        self.nodes_per_ply = []        # interior nodes visited at each ply from the root
+        self.leaf_evaluations = 0
+        self.beta_cutoffs = 0
+        self.tt_cutoffs = 0            # nodes answered straight from the transposition table
+        self.moves_searched = 0        # children tried below interior nodes
+        self.move_generation_time = 0.0
+        self.evaluation_time = 0.0
+        self.winner_check_time = 0.0
+        self.threat_nodes = 0
+        self.threat_time = 0.0
+        self.quiescence_nodes = 0      # positions looked at past the horizon
+        self.researches = 0            # null-window and aspiration fails searched again
+        self.iterations = []           # one entry per finished root search
+        self.principal_variation = []
+        self.move = None
+        self.score = None
+        self.reason = None             # why this move: 'forced', 'book', 'center', 'threat', 'search'
+        self.interrupted = False       # the last depth was cut short by the deadline or a stop
+        self.elapsed = 0.0
+
+    @property
+    def nodes(self):
+        return sum(self.nodes_per_ply)
+
+    @property
+    def branching_factor(self):
+        # average number of moves tried per interior node
+        nodes = self.nodes
+        return self.moves_searched / nodes if nodes else 0.0
+
+    @property
+    def effective_branching_factor(self):
+        # growth in nodes from the second last to the last finished depth
+        if len(self.iterations) < 2 or not self.iterations[-2]['nodes']:
+            return 0.0
+        return self.iterations[-1]['nodes'] / self.iterations[-2]['nodes']
+
+    def count_node(self, ply):
+        while len(self.nodes_per_ply) <= ply:
+            self.nodes_per_ply.append(0)
+        self.nodes_per_ply[ply] += 1
+
+    def merge(self, other):
+        # Add the counters of a search done elsewhere (a worker process)
+        for ply, nodes in enumerate(other.nodes_per_ply):
+            while len(self.nodes_per_ply) <= ply:
+                self.nodes_per_ply.append(0)
+            self.nodes_per_ply[ply] += nodes
+        for name in ('leaf_evaluations', 'beta_cutoffs', 'tt_cutoffs', 'moves_searched',
+                     'quiescence_nodes', 'researches',
+                     'move_generation_time', 'evaluation_time', 'winner_check_time'):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def as_dict(self):
+        return {
+            'move': self.move,
+            'score': self.score,
+            'reason': self.reason,
+            'interrupted': self.interrupted,
+            'elapsed': self.elapsed,
+            'nodes': self.nodes,
+            'nodes_per_ply': list(self.nodes_per_ply),
+            'leaf_evaluations': self.leaf_evaluations,
+            'beta_cutoffs': self.beta_cutoffs,
+            'tt_cutoffs': self.tt_cutoffs,
+            'quiescence_nodes': self.quiescence_nodes,
+            'researches': self.researches,
+            'branching_factor': self.branching_factor,
+            'effective_branching_factor': self.effective_branching_factor,
+            'move_generation_time': self.move_generation_time,
+            'evaluation_time': self.evaluation_time,
+            'winner_check_time': self.winner_check_time,
+            'threat_nodes': self.threat_nodes,
+            'threat_time': self.threat_time,
+            'iterations': list(self.iterations),
+            'principal_variation': list(self.principal_variation),
+        }
+
+
+class Threat:
+    """A run of two or more stones that can still be extended, or two runs
+    split by a single empty cell (`gap`) such as xx.x or xx.xx. (row, col)
+    is the first stone along `direction`."""
+
+    __slots__ = ('player', 'length', 'open_ends', 'row', 'col', 'order', 'direction', 'gap', 'key')
+
+    names = ('vertical', 'horizontal', 'diagonal_down', 'diagonal_up')
+
+    def __init__(self, player, length, open_ends, start, order, direction, gap=None):
+        self.player = player
+        self.length = length          # number of stones
+        self.open_ends = open_ends    # empty cells just outside the shape (0-2)
+        self.row, self.col = start
+        self.order = order            # index of the direction
+        self.direction = direction
+        self.gap = gap
+        # longest first, then more open ends, then board position
+        self.key = (-length, -open_ends, self.row, self.col, order, gap is not None)
+
+    @property
+    def type(self):
+        return self.names[self.order]
+
+    def __repr__(self):
+        gap = f", gap={self.gap}" if self.gap else ""
+        return (f"Threat({self.player!r}, {self.type}, ({self.row}, {self.col}), "
+                f"length={self.length}, open_ends={self.open_ends}{gap})")
+
+
+class Gomoku:
+    def __init__(self, tt_size_mb=16, tt_policy='depth', candidate_radius=1, workers=1, ai_player='O', size=15,
+                 sparse=None):
+        self.size = size
+        # Sparse board (default above 19x19): rows are dicts of the occupied
+        # cells and the per-cell and per-line tables are only filled in next
+        # to stones, so set-up time and memory don't grow with the board area
+        self.sparse = size > 19 if sparse is None else sparse
+        if self.sparse:
+            self.board = LazyTable(lambda row: SparseRow())
+        else:
+            self.board = [['.' for _ in range(self.size)] for _ in range(self.size)]
+        # The engine always searches for ai_player1; pass ai_player='X' for
+        # an engine that plays the other color.
+        self.ai_player1 = ai_player       #minimax
+        self.human_player = 'X' if ai_player == 'O' else 'O'
+        self.ai_player2 = self.human_player        #alpha beta
         self.max_depth = 3  
         self.winning_length = 5
+
+        # Cached game result, kept up to date by make_move/undo_move so that
+        # game_over() never has to scan the whole board.
+        self.winner = None
+        self.stone_count = 0
+        # (row, col, winner before the move) for every stone on the board
+        self.move_history = []
+
+        # Bitboards: one int per player with bit (row * stride + col) set for
+        # each of its stones. Every row has one spare column that is always
+        # empty, so shifting along a line never wraps onto the next row.
+        self.stride = self.size + 1
+        self.bitboards = {self.ai_player1: 0, self.human_player: 0, self.ai_player2: 0}
+        self.directions = [(1, 0), (0, 1), (1, 1), (1, -1)]
+        # how far one step along each direction moves a bit
+        self.shifts = [dr * self.stride + dc for dr, dc in self.directions]
+        self.board_mask = 0
+        for row in range(self.size):
+            self.board_mask |= ((1 << self.size) - 1) << (row * self.stride)
+        # Candidate moves: empty cells within candidate_radius of a stone.
+        # near_stones counts the stones around each cell so undo is exact.
+        self.candidate_radius = candidate_radius
+        if self.sparse:
+            self.build_sparse_tables()
+            self.neighbours = LazyTable(self.cell_neighbours)
+            self.near_stones = defaultdict(int)
+        else:
+            self.build_line_masks()
+            self.neighbours = [self.cell_neighbours(row * self.stride + col) if col < self.size else []
+                               for row in range(self.size) for col in range(self.stride)]
+            self.near_stones = [0] * (self.size * self.stride)
+        self.candidates = set()
+
+        # Stones per player in every five-cell window, and for each player
+        # the empty cells that would complete five (cell -> number of windows)
+        self.window_stones = {player: [0] * len(self.windows) for player in self.bitboards}
+        self.window_threat = [None] * len(self.windows)
+        self.win_cells = {player: {} for player in self.bitboards}
+        # windows holding three of a player's stones and nothing else, where
+        # either empty cell makes a four (see four_moves)
+        self.three_windows = {player: set() for player in self.bitboards}
+
+        # Zobrist hashing: a fixed random 64-bit key per (player, cell),
+        # xor-ed into self.hash by make_move/undo_move. The seed is fixed so
+        # keys are the same in every process.
+        keys = random.Random(20240515)
+        if self.sparse:
+            # one generator per key, made when the cell is first played
+            self.zobrist = {player: LazyTable(lambda index, seed=seed: random.Random(
+                                (20240515 << 32) + index * 2 + seed).getrandbits(64))
+                            for seed, player in enumerate(self.bitboards)}
+        else:
+            self.zobrist = {player: [keys.getrandbits(64) for _ in range(self.size * self.stride)]
+                            for player in self.bitboards}
+        # mixed into the table key when the minimizing side is to move
+        self.zobrist_side = keys.getrandbits(64)
+        self.hash = 0
+        self.tt = TranspositionTable(tt_size_mb, tt_policy)
+        # time.time() after which a timed search gives up, None = no limit
+        self.deadline = None
+        # Set from another thread (a threading.Event, or anything with
+        # is_set()) to stop the running search. The deadline and the stop
+        # token are checked every check_interval nodes (leaves included).
+        self.stop_token = None
+        self.check_interval = 128
+        self.check_countdown = self.check_interval
+        # best root move (and score) of the current iteration so far, played
+        # when a search is stopped before any depth finished
+        self.root_best = (None, float('-inf'))
+
+        # Move ordering tables for alpha-beta: up to two killer moves (moves
+        # that caused a cutoff) per ply, and a history score per player and
+        # cell that grows every time that move causes a cutoff.
+        self.killers = []
+        self.history = {player: defaultdict(int) for player in self.bitboards}
+        self.search_depth = 0
+        # use_alphabeta searches with pvs() (negamax principal variation
+        # search) unless use_pvs is False, which keeps Alpha_Beta_pruning.
+        # Iterative deepening first tries each depth with a window of
+        # +- aspiration_window (see aspiration_search). Past the horizon
+        # quiescence() plays on with fours for up to quiescence_depth plies,
+        # and with open threes in the first quiescence_three_depth of them.
+        self.use_pvs = True
+        self.aspiration_window = 100000
+        self.quiescence_depth = 4
+        self.quiescence_three_depth = 0
+        self.nodes = 0
+        # Instrumentation: stats of the current/last search, and callbacks
+        # hook(event, stats, info) called on 'start', 'node', 'iteration'
+        # and 'done'. With no hooks registered nothing extra is called.
+        self.stats = SearchStats()
+        self.search_hooks = []
+        # Pondering: a background search of the position after the human's
+        # expected reply, run while the human thinks (see start_ponder)
+        self.ponder_thread = None
+        self.ponder_stop = None
+        self.ponder_move = None
+        self.ponder_time_limit = 120
+        # principal variation of the last real search; ponder() starts new
+        # searches of its own, so self.stats can't be relied on for it
+        self.last_principal_variation = []
+        # worker processes for the root search (see gomoku_parallel)
+        self.workers = workers
+        self.pool = None
+        # Monte Carlo tree search (see gomoku_mcts), kept between moves. Without
+        # a time limit it runs mcts_iterations playouts.
+        self.mcts = None
+        self.mcts_iterations = 2000
+        self.mcts_max_nodes = 200_000
+        # Opening book (see gomoku_book), consulted for the first book_plies moves
+        self.book = None
+        self.book_plies = 10
+
+        # Threat-space solver run by get_ai_move before the main search.
+        # It only plays fours and open threes, so it reads much deeper.
+        self.use_threat_search = True
+        self.threat_max_plies = 25
+        self.threat_node_limit = 3000
+        self.threat_time_limit = 0.5   # seconds per move, shared by all solver calls
+        self.threat_nodes = 0
+        self.threat_deadline = None
+        self.threat_failed = {}
+        # (pattern score, threats) of a line keyed by the stones on it, and
+        # detect_threats results keyed by position hash. Both are cleared
+        # when they reach cache_limit entries.
+        self.line_cache = {}
+        self.threat_cache = {}
+        self.cache_limit = 200_000
+        # open threes ('x' = attacker): one more stone makes an open four
+        self.open_three_re = re.compile(r'(?=(\.xxx\.\.|\.\.xxx\.|\.xx\.x\.|\.x\.xx\.))')
         
         # 
         self.pattern_scores = {
@@ -65,34 +459,52 @@ class Gomoku:
             'corner': 200
         }
 
+        # Incremental evaluation: every line keeps its own pattern score and
+        # make_move/undo_move only rescore the four lines through the cell.
+        # Lines are scored in the 'o' (AI) / 'x' (human) alphabet of pattern_scores.
+        self.pattern_alphabet = str.maketrans({self.ai_player1: 'o', self.human_player: 'x'})
+        self.compile_pattern_tables()
+        self.build_bonus_tables()
+        self.center_score = 0
+        self.rescore_lines()
+
 
 
 
 
     def print_board(self):
+        rows = cols = range(self.size)
+        if self.sparse:
+            # only the part of the board around the stones
+            top, left, bottom, right = self.stone_bounds(margin=3)
+            rows, cols = range(top, bottom + 1), range(left, right + 1)
         # This line prints the column numbers (headers) with 2-space width for alignment.
-        print("   " + " ".join(f"{i:2}" for i in range(self.size)))
-        for i, row in enumerate(self.board):
-            print(f"{i:2} " + " ".join(f"{cell:2}" for cell in row))
+        print("   " + " ".join(f"{i:2}" for i in cols))
+        for i in rows:
+            print(f"{i:2} " + " ".join(f"{self.board[i][j]:2}" for j in cols))
+
+    def stone_bounds(self, margin=0):
+        # Bounding box (top, left, bottom, right) of the stones, widened by
+        # margin and clipped to the board; the center cell when it is empty
+        if not self.move_history:
+            top = bottom = left = right = self.size // 2
+        else:
+            rows = [row for row, col, _ in self.move_history]
+            cols = [col for row, col, _ in self.move_history]
+            top, bottom, left, right = min(rows), max(rows), min(cols), max(cols)
+        return (max(0, top - margin), max(0, left - margin),
+                min(self.size - 1, bottom + margin), min(self.size - 1, right + margin))
 
     def available_moves(self):
 
-          # Check immediate wins/blocks first
+          # Check immediate wins/blocks first (tracked by make_move/undo_move)
         for player in [self.ai_player1, self.ai_player2, self.human_player]:
-            for row in range(self.size):
-                for col in range(self.size):
-                    if self.board[row][col] == '.':
-                        self.board[row][col] = player
-                        if self.check_winner() == player:
-                            self.board[row][col] = '.'
-                            return [(row, col)]
-                        self.board[row][col] = '.'
+            cells = self.win_cells.get(player)
+            if cells:
+                return [divmod(min(cells), self.stride)]
         moves = set()
-    # Get moves near existing pieces
-        occupied = [(r, c) for r in range(self.size) 
-                           for c in range(self.size) if self.board[r][c] != '.']
         
-        if not occupied:
+        if not self.stone_count:
                     center = self.size // 2
                     if self.board[center][center] == '.':
                        return [(center, center)]
@@ -116,14 +528,7 @@ class Gomoku:
 
 
         #Add moves near existing pieces
-        for (row, col) in occupied:
-           for dr in [-1, 0, 1]:
-                for dc in [-1, 0, 1]:
-                    if dr == 0 and dc == 0:
-                        continue     
-                    r, c = row + dr, col + dc
-                    if 0 <= r < self.size and 0 <= c < self.size and self.board[r][c] == '.':
-                        moves.add((r, c))
+        moves.update(divmod(index, self.stride) for index in self.candidates)
 
         return list(moves) if moves else \
                 [(r, c) for r in range(self.size) 
@@ -134,195 +539,1298 @@ class Gomoku:
     def make_move(self, row, col, player):
         if 0 <= row < self.size and 0 <= col < self.size and self.board[row][col] == '.':
             self.board[row][col] = player
+            index = row * self.stride + col
+            self.bitboards[player] = self.bitboards.get(player, 0) | (1 << index)
+            self.hash ^= self.zobrist[player][index]
+            self.move_history.append((row, col, self.winner))
+            self.stone_count += 1
+            if player == self.ai_player1:
+                self.center_score += self.center_bonus[row][col]
+            self.update_lines(row, col)
+            # Only the four lines through the new stone can have changed
+            if self.winner is None and index in self.win_cells[player]:
+                self.winner = player
+            self.update_windows(index, player, 1)
+            self.update_candidates(index, 1)
             return True
         return False
 
+    def update_candidates(self, index, delta):
+        # Called after a stone was added (delta 1) or removed (delta -1) at
+        # index: keep near_stones and the candidate set in step
+        occupied = self.occupied_mask()
+        candidates = self.candidates
+        near_stones = self.near_stones
+        for near in self.neighbours[index]:
+            near_stones[near] += delta
+            if near_stones[near] == 0:
+                candidates.discard(near)
+            elif not occupied >> near & 1:
+                candidates.add(near)
+        if delta > 0:
+            candidates.discard(index)
+        elif near_stones[index]:
+            candidates.add(index)
+
+    def update_windows(self, index, player, delta):
+        # Called after a stone was added or removed at index: recount the
+        # five-cell windows through it and refresh which cells complete five
+        occupied = self.occupied_mask()
+        four = self.winning_length - 1
+        three = four - 1
+        for window in self.cell_windows[index]:
+            old = self.window_threat[window]
+            if old is not None:
+                owner, cell = old
+                cells = self.win_cells[owner]
+                cells[cell] -= 1
+                if not cells[cell]:
+                    del cells[cell]
+                self.window_threat[window] = None
+            self.window_stones[player][window] += delta
+            for owner, counts in self.window_stones.items():
+                stones = counts[window]
+                if stones < three - 1:
+                    continue
+                filled = (self.windows[window] & occupied).bit_count()
+                if stones == three and filled == three:
+                    self.three_windows[owner].add(window)
+                elif stones <= four:
+                    # it may have had three before this stone came or went
+                    self.three_windows[owner].discard(window)
+                # four of owner's stones and nothing else: the gap wins
+                if stones == four and filled == four:
+                    cell = (self.windows[window] & ~occupied).bit_length() - 1
+                    cells = self.win_cells[owner]
+                    cells[cell] = cells.get(cell, 0) + 1
+                    self.window_threat[window] = (owner, cell)
+
+    def undo_to(self, history_length):
+        # Take back moves until only the first history_length are left
+        while len(self.move_history) > history_length:
+            row, col = self.move_history[-1][:2]
+            self.undo_move(row, col)
+
+    def compact_position(self):
+        # The stones as a (player, bitboard) tuple, cheap to pickle
+        return tuple((player, stones) for player, stones in self.bitboards.items() if stones)
+
+    def load_position(self, position):
+        # Change the board to a compact_position() by removing and adding
+        # only the stones that differ
+        wanted = dict(position)
+        for player, stones in list(self.bitboards.items()):
+            for row, col in self.bit_cells(stones & ~wanted.get(player, 0)):
+                self.undo_move(row, col)
+        for player, stones in wanted.items():
+            for row, col in self.bit_cells(stones & ~self.bitboards.get(player, 0)):
+                self.make_move(row, col, player)
+
+    def open_book(self, path):
+        # Play from the opening book in `path` while the position is in it
+        from gomoku_book import OpeningBook
+        if self.book is not None:
+            self.book.close()
+        self.book = OpeningBook(path)
+
+    def close(self):
+        # Stop the worker processes, if any were started
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if self.book is not None:
+            self.book.close()
+            self.book = None
+
     def is_board_full(self):
-        return all('.' not in row for row in self.board)
+        return self.stone_count == self.size * self.size
+
+    def is_winning_move(self, row, col, player):
+        # Would a stone of `player` at (row, col) complete five in a row?
+        # Only the five-cell windows through that cell need checking.
+        # (For empty cells, win_cells already has the answer.)
+        index = row * self.stride + col
+        stones = self.bitboards.get(player, 0) | (1 << index)
+        for window in self.five_masks[index]:
+            if stones & window == window:
+                return True
+        return False
+
+    def cell_neighbours(self, index):
+        row, col = divmod(index, self.stride)
+        radius = self.candidate_radius
+        return [r * self.stride + c
+                for r in range(row - radius, row + radius + 1)
+                for c in range(col - radius, col + radius + 1)
+                if 0 <= r < self.size and 0 <= c < self.size and (r, c) != (row, col)]
+
+    def build_line_masks(self):
+        # Every row, column and diagonal as a list of cells plus a bitmask,
+        # and for each cell the masks of the five-in-a-row windows through it.
+        self.lines = []
+        self.line_masks = []
+        self.five_masks = [[] for _ in range(self.size * self.stride)]
+        self.windows = []
+        self.cell_windows = [[] for _ in range(self.size * self.stride)]
+        # indices into self.lines of the four lines through each cell
+        self.cell_lines = [[] for _ in range(self.size * self.stride)]
+        # cells at most two steps away along any of the four lines
+        self.near_masks = [0] * (self.size * self.stride)
+        # index into self.directions of every line
+        self.line_directions = []
+        for order, (dr, dc) in enumerate(self.directions):
+            for row in range(self.size):
+                for col in range(self.size):
+                    # only start a line on the first cell along this direction
+                    if 0 <= row - dr < self.size and 0 <= col - dc < self.size:
+                        continue
+                    cells = []
+                    r, c = row, col
+                    while 0 <= r < self.size and 0 <= c < self.size:
+                        cells.append((r, c))
+                        r, c = r + dr, c + dc
+                    bits = [1 << (r * self.stride + c) for r, c in cells]
+                    for r, c in cells:
+                        self.cell_lines[r * self.stride + c].append(len(self.lines))
+                    self.lines.append(cells)
+                    self.line_masks.append(sum(bits))
+                    self.line_directions.append(order)
+                    for i, (r, c) in enumerate(cells):
+                        # nearby cells on this line, used for move ordering
+                        for near in bits[max(0, i - 2):i] + bits[i + 1:i + 3]:
+                            self.near_masks[r * self.stride + c] |= near
+                    for start in range(len(cells) - self.winning_length + 1):
+                        window = sum(bits[start:start + self.winning_length])
+                        for r, c in cells[start:start + self.winning_length]:
+                            self.five_masks[r * self.stride + c].append(window)
+                            self.cell_windows[r * self.stride + c].append(len(self.windows))
+                        self.windows.append(window)
+
+    def build_sparse_tables(self):
+        # Same tables as build_line_masks, filled in cell by cell the first
+        # time a cell is looked at. Line and window indices are handed out
+        # in that order; a window is always created before a stone lands in it.
+        self.lines = []
+        self.line_masks = []
+        self.line_directions = []
+        self.line_ids = {}     # (direction index, first cell) -> line index
+        self.windows = []
+        self.window_ids = {}   # (line index, first position) -> window index
+        self.cell_lines = LazyTable(self.sparse_cell_lines)
+        self.cell_windows = LazyTable(self.sparse_cell_windows)
+        self.five_masks = LazyTable(lambda index: [self.windows[w] for w in self.cell_windows[index]])
+        self.near_masks = LazyTable(self.sparse_near_mask)
+
+    def line_start(self, row, col, order):
+        # First cell of the line through (row, col) along directions[order],
+        # and the position of (row, col) on it
+        dr, dc = self.directions[order]
+        back = row if dc == 0 else col if dr == 0 else min(row, col) if dc > 0 else min(row, self.size - 1 - col)
+        return (row - back * dr, col - back * dc), back
+
+    def sparse_cell_lines(self, index):
+        row, col = divmod(index, self.stride)
+        found = []
+        for order, (dr, dc) in enumerate(self.directions):
+            start, _ = self.line_start(row, col, order)
+            line_index = self.line_ids.get((order, start))
+            if line_index is None:
+                cells = []
+                r, c = start
+                while 0 <= r < self.size and 0 <= c < self.size:
+                    cells.append((r, c))
+                    r, c = r + dr, c + dc
+                line_index = self.line_ids[(order, start)] = len(self.lines)
+                self.lines.append(cells)
+                self.line_masks.append(sum(1 << (r * self.stride + c) for r, c in cells))
+                self.line_directions.append(order)
+                self.line_scores.append(0)
+                self.line_threats.append(())
+            found.append(line_index)
+        return found
+
+    def sparse_cell_windows(self, index):
+        row, col = divmod(index, self.stride)
+        found = []
+        for line_index in self.cell_lines[index]:
+            cells = self.lines[line_index]
+            _, pos = self.line_start(row, col, self.line_directions[line_index])
+            for start in range(max(0, pos - self.winning_length + 1), min(pos, len(cells) - self.winning_length) + 1):
+                window = self.window_ids.get((line_index, start))
+                if window is None:
+                    window = self.window_ids[(line_index, start)] = len(self.windows)
+                    self.windows.append(sum(1 << (r * self.stride + c)
+                                            for r, c in cells[start:start + self.winning_length]))
+                    for counts in self.window_stones.values():
+                        counts.append(0)
+                    self.window_threat.append(None)
+                found.append(window)
+        return found
+
+    def sparse_near_mask(self, index):
+        row, col = divmod(index, self.stride)
+        mask = 0
+        for dr, dc in self.directions:
+            for step in (-2, -1, 1, 2):
+                r, c = row + dr * step, col + dc * step
+                if 0 <= r < self.size and 0 <= c < self.size:
+                    mask |= 1 << (r * self.stride + c)
+        return mask
+
+    def line_segment(self, line_index):
+        # The cells of a line worth scanning. On a sparse board that is the
+        # stretch from winning_length cells before its first stone to as far
+        # after its last one: every pattern and threat lies inside it.
+        cells = self.lines[line_index]
+        if not self.sparse:
+            return cells
+        stones = self.occupied_mask() & self.line_masks[line_index]
+        if not stones:
+            return []
+        # bit indices grow along every line direction
+        first_bit = cells[0][0] * self.stride + cells[0][1]
+        shift = self.shifts[self.line_directions[line_index]]
+        first = ((stones & -stones).bit_length() - 1 - first_bit) // shift
+        last = (stones.bit_length() - 1 - first_bit) // shift
+        return cells[max(0, first - self.winning_length):last + self.winning_length + 1]
+
+    def occupied_mask(self):
+        mask = 0
+        for stones in self.bitboards.values():
+            mask |= stones
+        return mask
+
+    def bit_cells(self, mask):
+        # (row, col) of every set bit, in row-major order
+        while mask:
+            low = mask & -mask
+            yield divmod(low.bit_length() - 1, self.stride)
+            mask ^= low
 
     def check_winner(self):
-        directions = [(1, 0), (0, 1), (1, 1), (1, -1)]
-        
-        for row in range(self.size):
-            for col in range(self.size):
-                if self.board[row][col] != '.':
-                    player = self.board[row][col]
-                    for dr, dc in directions:
-                        count = 1
-                        for i in range(1, self.winning_length):
-                            r, c = row + dr * i, col + dc * i
-                            if 0 <= r < self.size and 0 <= c < self.size and self.board[r][c] == player:
-                                count += 1
-                            else:
-                                break
-                        if count >= self.winning_length:
-                            return player
+        return self.winner
+
+    def scan_winner(self):
+        # Full-board check, only needed when the cached result can't be trusted.
+        # A bit survives the ANDs only if it starts a run of winning_length stones.
+        for player, stones in self.bitboards.items():
+            for shift in self.shifts:
+                run = stones
+                for i in range(1, self.winning_length):
+                    run &= stones >> (shift * i)
+                if run:
+                    return player
         return None
     def game_over(self):
         return self.check_winner() is not None or self.is_board_full()
 
     
     def evaluate_board(self):
-        total_score = 0
+        # Win/loss first, the pattern scores don't matter any more
+        if self.winner == self.ai_player1:
+            return 1_000_000
+        if self.winner == self.human_player:
+            return -1_000_000
 
-        # Get all lines (rows, cols, diagonals)
-        lines = []
-        corners = [(0,0), (0,self.size-1), (self.size-1,0), (self.size-1,self.size-1)]
+        # Center and corner bonuses plus the cached score of every line
+        # (rows, cols, diagonals); all kept up to date by make_move/undo_move.
+        return self.corner_score + self.center_score + self.line_score_total
 
-        # Center bonus
-        center = self.size // 2
-        for row in range(self.size):
-            for col in range(self.size):
-                piece = self.board[row][col]
-                if piece == self.ai_player1:  # AI piece
-                    dist = abs(center - row) + abs(center - col)
-                    # rewards the AI for placing pieces closer to the center.
-                    total_score += self.pattern_scores.get('center', 0) - dist * 10
-                
-                # Corner control
-                if (row, col) in corners:
-                    total_score += self.pattern_scores.get('corner', 0)
+    def line_string(self, line_index):
+        return ''.join(self.board[r][c] for r, c in self.lines[line_index]).translate(self.pattern_alphabet)
 
+    def compile_pattern_tables(self):
+        # pattern_scores compiled once into base-3 lookup tables, one per
+        # pattern length: table[code] is the total value of the patterns that
+        # match that window exactly ('.' = 0, 'o' = 1, 'x' = 2, first cell
+        # is the most significant digit).
+        digits = {'.': 0, 'o': 1, 'x': 2}
+        tables = {}
+        for pattern, value in self.pattern_scores.items():
+            if pattern in ('center', 'corner'):
+                continue  # Board-wide bonuses, handled separately
+            table = tables.setdefault(len(pattern), [0] * 3 ** len(pattern))
+            code = 0
+            for ch in pattern:
+                code = code * 3 + digits[ch]
+            table[code] += value
+        self.window_tables = [(length, 3 ** length, table) for length, table in sorted(tables.items())]
+        self.board_digits = {'.': 0, self.ai_player1: 1, self.human_player: 2}
 
-        # Rows
-        for row in self.board:
-            lines.append(''.join(row))
+    def build_bonus_tables(self):
+        # Center bonus of every cell and the corner score, from pattern_scores
+        center = self.size // 2
+        corners = {(0,0), (0,self.size-1), (self.size-1,0), (self.size-1,self.size-1)}
+        # the corner bonus is given for every corner, occupied or not
+        self.corner_score = len(corners) * self.pattern_scores.get('corner', 0)
+        center_value = self.pattern_scores.get('center', 0)
+        if self.sparse:
+            self.center_bonus = LazyTable(lambda r: LazyTable(
+                lambda c: center_value - (abs(center - r) + abs(center - c)) * 10))
+        else:
+            self.center_bonus = [[center_value - (abs(center - r) + abs(center - c)) * 10
+                                  for c in range(self.size)] for r in range(self.size)]
 
-        # Columns
-        for col in range(self.size):
-            line = ''.join(self.board[row][col] for row in range(self.size))
-            lines.append(line)
+    def set_pattern_scores(self, scores):
+        # New evaluation weights (e.g. from gomoku_tune.py). Patterns not in
+        # `scores` keep their value. The position is rescored and everything
+        # computed with the old weights is dropped: line cache, threat cache,
+        # transposition table and the worker processes.
+        self.pattern_scores.update(scores)
+        self.compile_pattern_tables()
+        self.build_bonus_tables()
+        self.center_score = sum(self.center_bonus[row][col] for row, col, _ in self.move_history
+                                if self.board[row][col] == self.ai_player1)
+        self.line_cache.clear()
+        self.threat_cache.clear()
+        self.tt.clear()
+        self.mcts = None
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        self.rescore_lines()
 
-        # Diagonals
-        for i in range(-self.size + 1, self.size):
-            diag1 = ''.join(self.board[i + j][j] for j in range(self.size)
-                            if 0 <= i + j < self.size and 0 <= j < self.size)
-            diag2 = ''.join(self.board[i + j][self.size - 1 - j] for j in range(self.size)
-                            if 0 <= i + j < self.size and 0 <= j < self.size)
-            lines.extend([diag1, diag2])
+    def load_pattern_scores(self, path):
+        # Read weights written by gomoku_tune.py (a JSON object pattern -> score)
+        with open(path) as f:
+            scores = json.load(f)
+        unknown = set(scores) - set(self.pattern_scores)
+        if unknown:
+            raise ValueError(f"{path}: unknown patterns {sorted(unknown)}")
+        self.set_pattern_scores({pattern: int(value) for pattern, value in scores.items()})
 
+    def score_line(self, line_index):
+        # Scores one line in a single pass: a rolling base-3 code per pattern
+        # length looks the window up in window_tables, and runs of human
+        # stones are penalised as they end. Same totals as score_line_regex.
+        total_score = 0
+        digits = self.board_digits
+        board = self.board
+        tables = self.window_tables
+        codes = [0] * len(tables)
+        run = 0
+        open_before = False
+        prev = 2  # the edge of the board counts as blocked
+        for i, (r, c) in enumerate(self.line_segment(line_index)):
+            digit = digits[board[r][c]]
+            for k, (length, modulus, table) in enumerate(tables):
+                codes[k] = (codes[k] * 3 + digit) % modulus
+                if i >= length - 1:
+                    total_score += table[codes[k]]
+            if digit == 2:
+                if run == 0:
+                    open_before = prev == 0
+                run += 1
+            elif run:
+                total_score += self.run_penalty(run, open_before + (digit == 0))
+                run = 0
+            prev = digit
+        if run:
+            total_score += self.run_penalty(run, open_before)
+        return total_score
 
-        full_board_string = ''.join(lines)
-        if 'ooooo' in full_board_string:
-            return 1_000_000
-        if 'xxxxx' in full_board_string:
-            return -1_000_000
+    def run_penalty(self, length, open_ends):
+        # Additional defensive consideration for a run of human stones
+        # (same rules as the runs detect_threats reports)
+        if open_ends == 0:
+            return 0
+        if length >= 3:
+            return -50000 * length  # Big penalty for human threats
+        if length == 2 and open_ends == 2:
+            return -20000  # Penalty for open two
+        return 0
+
+    def score_line_regex(self, line):
+        # Reference scorer working on a line string, one regex per pattern.
+        # Slow; kept to check the lookup tables against.
+        total_score = 0
 
         # Pattern scoring
-        for line in lines:
-            for pattern, value in self.pattern_scores.items():
-                        if pattern == 'center':
-                            continue  # Skip 'center' here, it’s handled separately
-                        count = len(re.findall(f'(?={pattern})', line))
-                        total_score += count * value    
-           
-        # Additional defensive consideration - count human threats
-        human_threats = self.detect_threats(self.human_player)
-        for threat in human_threats:
-            if threat['length'] >= 3:
-                total_score -= 50000 * threat['length']  # Big penalty for human threats
-            elif threat['length'] == 2 and threat['open_ends'] == 2:
-                total_score -= 20000  # Penalty for open two
+        for pattern, value in self.pattern_scores.items():
+            if pattern in ('center', 'corner'):
+                continue  # Board-wide bonuses, handled separately
+            count = len(re.findall(f'(?={re.escape(pattern)})', line))
+            total_score += count * value
 
+        # Additional defensive consideration - human runs along this line
+        # (same rules as the runs detect_threats reports)
+        for run in re.finditer('x+', line):
+            start, end = run.span()
+            open_ends = (start > 0 and line[start - 1] == '.') + (end < len(line) and line[end] == '.')
+            total_score += self.run_penalty(end - start, open_ends)
 
         return total_score
 
-    
+    def line_entry(self, line_index):
+        # (score, threats) of a line, computed once per arrangement of stones
+        mask = self.line_masks[line_index]
+        ai = self.bitboards[self.ai_player1] & mask
+        human = self.bitboards[self.human_player] & mask
+        if self.sparse:
+            # keep the key small: the stones relative to the lowest one
+            low = max(0, ((ai | human) & -(ai | human)).bit_length() - 1)
+            key = (line_index, low, ai >> low, human >> low)
+        else:
+            key = (line_index, ai, human)
+        entry = self.line_cache.get(key)
+        if entry is None:
+            if len(self.line_cache) >= self.cache_limit:
+                self.line_cache.clear()
+            entry = self.line_cache[key] = (self.score_line(line_index), self.scan_line_threats(line_index))
+        return entry
+
+    def update_lines(self, row, col):
+        # Only the four lines through (row, col) changed
+        for line_index in self.cell_lines[row * self.stride + col]:
+            score, threats = self.line_entry(line_index)
+            self.line_score_total += score - self.line_scores[line_index]
+            self.line_scores[line_index] = score
+            self.line_threats[line_index] = threats
+            if threats:
+                self.threat_lines.add(line_index)
+            else:
+                self.threat_lines.discard(line_index)
+
+    def rescore_lines(self):
+        # Score every line from scratch
+        entries = [self.line_entry(i) for i in range(len(self.lines))]
+        self.line_scores = [score for score, threats in entries]
+        self.line_score_total = sum(self.line_scores)
+        self.line_threats = [threats for score, threats in entries]
+        # lines with at least one threat on them
+        self.threat_lines = {i for i, threats in enumerate(self.line_threats) if threats}
+
     def undo_move(self, row,col):
         # row, col = move
+        player = self.board[row][col]
+        if player == '.':
+            return
         self.board[row][col] = '.'
+        index = row * self.stride + col
+        self.bitboards[player] &= ~(1 << index)
+        self.hash ^= self.zobrist[player][index]
+        self.stone_count -= 1
+        if player == self.ai_player1:
+            self.center_score -= self.center_bonus[row][col]
+        self.update_lines(row, col)
+        self.update_windows(index, player, -1)
+        self.update_candidates(index, -1)
+        if self.move_history and self.move_history[-1][:2] == (row, col):
+            winner = self.move_history.pop()[2]
+            self.winner = self.scan_winner() if winner is RESCAN else winner
+        else:
+            # Undone out of order: drop the entry and rescan once. The winners
+            # stored by the later moves may have counted this stone, so they
+            # are rescanned as well when those moves are undone.
+            k = next((i for i, m in enumerate(self.move_history) if m[:2] == (row, col)),
+                     len(self.move_history))
+            self.move_history = self.move_history[:k] + [(r, c, RESCAN) for r, c, _ in self.move_history[k + 1:]]
+            self.winner = self.scan_winner()
 
     def Alpha_Beta_pruning(self, depth, is_maximizing,alpha,beta):
-        if depth == 0 or self.game_over():
-            return self.evaluate_board()
-        
+        self.check_countdown -= 1
+        if self.check_countdown <= 0:
+            self.check_stop()
+        if depth == 0 or self.timed_game_over():
+            return self.timed_evaluate()
+        self.nodes += 1
+        ply = self.search_depth - depth
+        self.stats.count_node(ply)
+        if self.search_hooks:
+            self.emit('node', ply=ply, depth=depth)
+
+        # Transposition table: reuse a result from another move order
+        key = self.hash if is_maximizing else self.hash ^ self.zobrist_side
+        alpha_orig, beta_orig = alpha, beta
+        hash_move = None
+        entry = self.tt.lookup(key)
+        if entry is not None:
+            entry_depth, entry_score, flag, hash_move = entry
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    self.stats.tt_cutoffs += 1
+                    return entry_score
+                if flag == LOWER:
+                    alpha = max(alpha, entry_score)
+                else:
+                    beta = min(beta, entry_score)
+                if alpha >= beta:
+                    self.stats.tt_cutoffs += 1
+                    return entry_score
+
         player = self.ai_player1 if is_maximizing else self.ai_player2
+        opponent = self.ai_player2 if is_maximizing else self.ai_player1
         best_score = float('-inf') if is_maximizing else float('inf')
-        
-        for row, col in self.available_moves():
+        best_move = None
+
+        moves = self.order_moves(self.timed_available_moves(), player, opponent, ply, hash_move)
+
+        for row, col in moves:
+            self.stats.moves_searched += 1
             self.make_move(row,col,player)
-            # self.board[row][col] = player
-            score = self.Alpha_Beta_pruning(depth-1, alpha, beta, not is_maximizing)
-            # self.board[row][col] = '.'
+            score = self.Alpha_Beta_pruning(depth-1, not is_maximizing, alpha, beta)
             self.undo_move(row,col)
             if is_maximizing:
-                best_score = max(score, best_score)
+                if score > best_score:
+                    best_score, best_move = score, (row, col)
                 alpha = max(alpha, best_score)
             else:
-                best_score = min(score, best_score)
+                if score < best_score:
+                    best_score, best_move = score, (row, col)
                 beta = min(beta, best_score)
             
             if alpha >= beta:
+                self.stats.beta_cutoffs += 1
+                self.record_cutoff((row, col), player, ply, depth)
                 break
-                
+
+        if best_score <= alpha_orig:
+            flag = UPPER
+        elif best_score >= beta_orig:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.tt.store(key, depth, best_score, flag, best_move)
         return best_score
     
 
-    def minimax(self, depth, is_maximizing):
-        if depth == 0 or self.game_over():
-            return self.evaluate_board()
-        
+    def pvs(self, depth, alpha, beta, is_maximizing):
+        # Negamax principal variation search: the score is for the side to
+        # move (the AI when is_maximizing), so each ply negates and swaps
+        # the window. The first move gets the full window; the others only a
+        # null window asking "better than alpha?" and are searched again
+        # with the full window when the answer is yes.
+        self.check_countdown -= 1
+        if self.check_countdown <= 0:
+            self.check_stop()
+        if self.timed_game_over():
+            return self.side_evaluate(is_maximizing)
+        if depth <= 0:
+            return self.quiescence(alpha, beta, is_maximizing, 0)
+        self.nodes += 1
+        ply = self.search_depth - depth
+        self.stats.count_node(ply)
+        if self.search_hooks:
+            self.emit('node', ply=ply, depth=depth)
+
+        # The transposition table keeps the AI's scores, as Alpha_Beta_pruning
+        # does, so the human's are turned round (and their bounds swapped)
+        sign = 1 if is_maximizing else -1
+        key = self.hash if is_maximizing else self.hash ^ self.zobrist_side
+        alpha_orig = alpha
+        hash_move = None
+        entry = self.tt.lookup(key)
+        if entry is not None:
+            entry_depth, entry_score, flag, hash_move = entry
+            if entry_depth >= depth:
+                entry_score *= sign
+                if flag != EXACT and not is_maximizing:
+                    flag = LOWER if flag == UPPER else UPPER
+                if flag == EXACT:
+                    self.stats.tt_cutoffs += 1
+                    return entry_score
+                if flag == LOWER:
+                    alpha = max(alpha, entry_score)
+                else:
+                    beta = min(beta, entry_score)
+                if alpha >= beta:
+                    self.stats.tt_cutoffs += 1
+                    return entry_score
+
+        player = self.ai_player1 if is_maximizing else self.ai_player2
+        opponent = self.ai_player2 if is_maximizing else self.ai_player1
+        best_score = float('-inf')
+        best_move = None
+
+        moves = self.order_moves(self.timed_available_moves(), player, opponent, ply, hash_move)
+
+        for i, (row, col) in enumerate(moves):
+            self.stats.moves_searched += 1
+            self.make_move(row, col, player)
+            if i == 0:
+                score = -self.pvs(depth - 1, -beta, -alpha, not is_maximizing)
+            else:
+                score = -self.pvs(depth - 1, -alpha - 1, -alpha, not is_maximizing)
+                if alpha < score < beta:
+                    self.stats.researches += 1
+                    score = -self.pvs(depth - 1, -beta, -alpha, not is_maximizing)
+            self.undo_move(row, col)
+            if score > best_score:
+                best_score, best_move = score, (row, col)
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                self.stats.beta_cutoffs += 1
+                self.record_cutoff((row, col), player, ply, depth)
+                break
+
+        if best_score <= alpha_orig:
+            flag = UPPER if is_maximizing else LOWER
+        elif best_score >= beta:
+            flag = LOWER if is_maximizing else UPPER
+        else:
+            flag = EXACT
+        self.tt.store(key, depth, best_score * sign, flag, best_move)
+        return best_score
+
+    def quiescence(self, alpha, beta, is_maximizing, qply):
+        # Past the horizon a position is only scored when it is quiet. The
+        # side to move wins if it has a four, must block if it faces one,
+        # and otherwise takes the static score or plays on with a four (or,
+        # in the first quiescence_three_depth plies, an open three).
+        self.check_countdown -= 1
+        if self.check_countdown <= 0:
+            self.check_stop()
+        self.stats.quiescence_nodes += 1
+        if self.winner is not None or self.is_board_full():
+            return self.side_evaluate(is_maximizing)
+        player = self.ai_player1 if is_maximizing else self.ai_player2
+        opponent = self.ai_player2 if is_maximizing else self.ai_player1
+        if self.win_cells[player]:
+            return 1_000_000
+        threats = self.win_cells[opponent]
+        if threats and qply < self.quiescence_depth:
+            if len(threats) > 1:
+                return -1_000_000
+            row, col = divmod(next(iter(threats)), self.stride)
+            self.make_move(row, col, player)
+            score = -self.quiescence(-beta, -alpha, not is_maximizing, qply + 1)
+            self.undo_move(row, col)
+            return score
+
+        best_score = self.side_evaluate(is_maximizing)
+        if best_score >= beta or qply >= self.quiescence_depth:
+            return best_score
+        alpha = max(alpha, best_score)
+        moves = []
+        if self.three_windows[player]:
+            moves = self.four_moves(player)
+        if qply < self.quiescence_three_depth:
+            moves += [move for move in self.open_three_moves(player, opponent) if move not in moves]
+        for row, col in moves:
+            self.make_move(row, col, player)
+            score = -self.quiescence(-beta, -alpha, not is_maximizing, qply + 1)
+            self.undo_move(row, col)
+            if score > best_score:
+                best_score = score
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+        return best_score
+
+    def side_evaluate(self, is_maximizing):
+        # evaluate_board for the side to move
+        score = self.timed_evaluate()
+        return score if is_maximizing else -score
+
+    def order_moves(self, moves, player, opponent, ply, hash_move=None):
+        # Best candidates first so alpha-beta cuts off early: the move from
+        # the transposition table, immediate wins, immediate blocks, killer
+        # moves for this ply, then by history score, then by how many stones
+        # (own counted double) are close to the move.
+        if len(moves) < 2:
+            return moves
+        killers = self.killers[ply] if ply < len(self.killers) else []
+        history = self.history[player]
+        own = self.bitboards.get(player, 0)
+        other = self.bitboards.get(opponent, 0)
+
+        def priority(move):
+            row, col = move
+            index = row * self.stride + col
+            if move == hash_move:
+                tier = 5
+            elif index in self.win_cells[player]:
+                tier = 4
+            elif index in self.win_cells[opponent]:
+                tier = 3
+            elif move in killers:
+                tier = 2
+            else:
+                tier = 0
+            near = self.near_masks[index]
+            return (tier, history.get(index, 0), 2 * (own & near).bit_count() + (other & near).bit_count())
+
+        return sorted(moves, key=priority, reverse=True)
+
+    def record_cutoff(self, move, player, ply, depth):
+        # Remember a move that refuted the opponent's last move
+        while len(self.killers) <= ply:
+            self.killers.append([])
+        killers = self.killers[ply]
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[2:]
+        row, col = move
+        self.history[player][row * self.stride + col] += depth * depth
+
+    def check_stop(self):
+        # Raises SearchTimeout once the search has been told to stop or is
+        # past its deadline
+        self.check_countdown = self.check_interval
+        if self.stop_token is not None and self.stop_token.is_set():
+            raise SearchTimeout()
+        if self.deadline is not None and time.time() >= self.deadline:
+            raise SearchTimeout()
+
+    def timed_game_over(self):
+        start = time.perf_counter()
+        over = self.game_over()
+        self.stats.winner_check_time += time.perf_counter() - start
+        return over
+
+    def timed_evaluate(self):
+        start = time.perf_counter()
+        score = self.evaluate_board()
+        self.stats.evaluation_time += time.perf_counter() - start
+        self.stats.leaf_evaluations += 1
+        return score
+
+    def timed_available_moves(self):
+        start = time.perf_counter()
         moves = self.available_moves()
+        self.stats.move_generation_time += time.perf_counter() - start
+        return moves
+
+    def add_search_hook(self, hook):
+        self.search_hooks.append(hook)
+
+    def remove_search_hook(self, hook):
+        self.search_hooks.remove(hook)
+
+    def emit(self, event, **info):
+        for hook in self.search_hooks:
+            hook(event, self.stats, info)
+
+    def principal_variation(self, first_move, max_length):
+        # The expected line of play: the root move, then the best moves
+        # stored in the transposition table for the positions that follow
+        line = []
+        history_length = len(self.move_history)
+        move, is_maximizing = first_move, True
+        try:
+            while move is not None and len(line) < max_length and not self.game_over():
+                player = self.ai_player1 if is_maximizing else self.ai_player2
+                if not self.make_move(move[0], move[1], player):
+                    break
+                line.append(move)
+                is_maximizing = not is_maximizing
+                entry = self.tt.peek(self.hash if is_maximizing else self.hash ^ self.zobrist_side)
+                move = entry[3] if entry is not None else None
+        finally:
+            self.undo_to(history_length)
+        return line
+
+    def new_search(self):
+        # Called once per AI move: age the tables from the previous move
+        self.stats = SearchStats()
+        self.tt.new_search()
+        self.killers = []
+        for scores in self.history.values():
+            for i, score in list(scores.items()):
+                if score > 1:
+                    scores[i] = score // 2
+                else:
+                    del scores[i]
+        self.nodes = 0
+
+    def minimax(self, depth, is_maximizing):
+        self.check_countdown -= 1
+        if self.check_countdown <= 0:
+            self.check_stop()
+        if depth == 0 or self.timed_game_over():
+            return self.timed_evaluate()
+        self.nodes += 1
+        ply = self.search_depth - depth
+        self.stats.count_node(ply)
+        if self.search_hooks:
+            self.emit('node', ply=ply, depth=depth)
+
+        # Minimax scores are always exact, any deep enough entry will do
+        key = self.hash if is_maximizing else self.hash ^ self.zobrist_side
+        entry = self.tt.lookup(key)
+        if entry is not None and entry[0] >= depth and entry[2] == EXACT:
+            self.stats.tt_cutoffs += 1
+            return entry[1]
+
+        moves = self.timed_available_moves()
+        self.stats.moves_searched += len(moves)
+        best_move = None
         
         if is_maximizing:
             best_score = float('-inf')
             for row, col in moves:
-                self.board[row][col] = self.ai_player1
+                self.make_move(row, col, self.ai_player1)
                 score = self.minimax(depth - 1, False)
-                self.board[row][col] = '.'
-                best_score = max(score, best_score)
-            return best_score
+                self.undo_move(row, col)
+                if score > best_score:
+                    best_score, best_move = score, (row, col)
         else:
             best_score = float('inf')
             for row, col in moves:
-                self.board[row][col] = self.human_player
+                self.make_move(row, col, self.human_player)
                 score = self.minimax(depth - 1, True)
-                self.board[row][col] = '.'
-                best_score = min(score, best_score)
-            return best_score
+                self.undo_move(row, col)
+                if score < best_score:
+                    best_score, best_move = score, (row, col)
+        self.tt.store(key, depth, best_score, EXACT, best_move)
+        return best_score
 
     
-    def get_ai_move(self,use_alphabeta=True):
+    def get_ai_move(self,use_alphabeta=True, time_limit=None, return_stats=False, stop=None, use_mcts=False):
+        # Returns the move, or (move, SearchStats) with return_stats=True.
+        # The stats of the last call are also kept in self.stats.
+        # Setting the `stop` event from another thread ends the search
+        # early with the best move found so far. use_mcts=True searches
+        # with Monte Carlo tree search instead of minimax/alpha-beta.
+        start = time.time()
+        self.new_search()
+        if self.search_hooks:
+            self.emit('start', time_limit=time_limit, use_alphabeta=use_alphabeta)
+        self.stop_token = stop
+        try:
+            move = self.choose_ai_move(use_alphabeta, time_limit, use_mcts)
+        finally:
+            self.stop_token = None
+        stats = self.stats
+        stats.move = move
+        stats.elapsed = time.time() - start
+        if stats.iterations and not stats.principal_variation:
+            stats.principal_variation = self.principal_variation(move, stats.iterations[-1]['depth'])
+        self.last_principal_variation = list(stats.principal_variation)
+        if self.search_hooks:
+            self.emit('done', move=move)
+        return (move, stats) if return_stats else move
+
+    def choose_ai_move(self, use_alphabeta, time_limit, use_mcts=False):
         # First check for immediate wins/blocks
         moves = self.available_moves()
         if len(moves) == 1:
+            self.stats.reason = 'forced'
             return moves[0]
-        
+
+        if self.book is not None and self.stone_count < self.book_plies:
+            move = self.book.lookup(self)
+            if move is not None:
+                self.stats.reason = 'book'
+                return move
+
         # Try center first if empty
         center = self.size // 2
         if self.board[center][center] == '.':
+            self.stats.reason = 'center'
             return (center, center)
-        
+
+        # Forced wins first: threat-space search for the AI, then for the
+        # opponent (if they have one, only keep moves that stop it)
+        if self.use_threat_search:
+            start = time.time()
+            budget = self.threat_time_limit
+            if time_limit is not None:
+                budget = min(budget, time_limit / 2)
+            line = self.threat_space_search(self.ai_player1, time_limit=budget)
+            if line:
+                self.stats.reason = 'threat'
+                self.stats.principal_variation = line
+                return line[0]
+            deadline = start + budget
+            opponent = self.other_player(self.ai_player1)
+            line = self.threat_space_search(opponent, time_limit=deadline - time.time())
+            if line:
+                moves = self.threat_defences(moves, line, deadline)
+                if len(moves) == 1:
+                    self.stats.reason = 'forced'
+                    return moves[0]
+            if time_limit is not None:
+                time_limit -= time.time() - start
+
+        self.stats.reason = 'search'
+        if use_mcts:
+            return self.mcts_move(moves, time_limit) or random.choice(moves)
+        if time_limit is not None:
+            return self.iterative_deepening(moves, use_alphabeta, time_limit)
+
         # Limit number of moves to evaluate
         max_moves_to_consider = 20
         if len(moves) > max_moves_to_consider:
             moves = random.sample(moves, max_moves_to_consider)
-        
+        if use_alphabeta:
+            moves = self.order_moves(moves, self.ai_player1, self.ai_player2, 0)
+
+        history_length = len(self.move_history)
+        try:
+            best_move, best_score, scores = self.search_root(moves, self.max_depth, use_alphabeta)
+        except SearchTimeout:
+            # Stopped: the best of the root moves that were searched
+            self.undo_to(history_length)
+            self.stats.interrupted = True
+            best_move = self.root_best[0]
+        return best_move or random.choice(moves)
+
+    def mcts_move(self, moves, time_limit):
+        # Monte Carlo tree search over the root moves; with several workers
+        # each process grows its own tree and the visit counts are added up
+        if self.workers > 1:
+            if self.pool is None:
+                from gomoku_parallel import RootSearchPool
+                self.pool = RootSearchPool(self.workers, self.ai_player1, self.size, self.pattern_scores)
+            return self.pool.search_mcts(self, moves, time_limit, self.mcts_iterations)
+        if self.mcts is None:
+            from gomoku_mcts import MCTS
+            self.mcts = MCTS(self, self.mcts_max_nodes)
+        return self.mcts.search(self.ai_player1, moves, time_limit, self.mcts_iterations)
+
+    def search_root(self, moves, depth, use_alphabeta, window=None):
+        # Tries every root move for the AI and searches the reply tree
+        # depth - 1 plies deep. Returns the best move, its score and the
+        # score of each move that was searched. A score outside `window`
+        # (alpha, beta) is only a bound and the search isn't recorded.
+        start = time.time()
+        nodes_before = self.stats.nodes
+        self.root_best = (None, float('-inf'))
+        if self.workers > 1:
+            if self.pool is None:
+                from gomoku_parallel import RootSearchPool
+                self.pool = RootSearchPool(self.workers, self.ai_player1, self.size, self.pattern_scores)
+            result = self.pool.search_root(self, moves, depth, use_alphabeta)
+        else:
+            result = self.search_root_moves(moves, depth, use_alphabeta, window)
+
+        best_move, best_score, scores = result
+        if window is not None and not window[0] < best_score < window[1]:
+            return result
+        self.stats.score = best_score
+        self.stats.iterations.append({
+            'depth': depth,
+            'seconds': time.time() - start,
+            'nodes': self.stats.nodes - nodes_before,
+            'move': best_move,
+            'score': best_score,
+        })
+        if self.search_hooks:
+            self.emit('iteration', depth=depth, move=best_move, score=best_score)
+        return result
+
+    def search_root_moves(self, moves, depth, use_alphabeta, window=None):
         best_score = float('-inf')
         best_move = None  
-        alpha = float('-inf')
-        beta = float('inf')
+        alpha, beta = window or (float('-inf'), float('inf'))
+        scores = {}
+        self.search_depth = depth
+        self.stats.count_node(0)
 
         for row, col in moves:
-            self.board[row][col] = self.ai_player1
-            if(use_alphabeta):
-                score = self.Alpha_Beta_pruning(self.max_depth-1 ,False, alpha , beta)
-            else:    
-                score = self.minimax(self.max_depth - 1, False)
-            self.board[row][col] = '.'
+            self.check_stop()
+            self.stats.moves_searched += 1
+            self.make_move(row, col, self.ai_player1)
+            try:
+                if use_alphabeta and self.use_pvs:
+                    if best_move is None:
+                        score = -self.pvs(depth - 1, -beta, -alpha, False)
+                    else:
+                        score = -self.pvs(depth - 1, -alpha - 1, -alpha, False)
+                        if alpha < score < beta:
+                            self.stats.researches += 1
+                            score = -self.pvs(depth - 1, -beta, -alpha, False)
+                elif(use_alphabeta):
+                    score = self.Alpha_Beta_pruning(depth-1 ,False, alpha , beta)
+                else:    
+                    score = self.minimax(depth - 1, False)
+            finally:
+                self.undo_move(row, col)
+            scores[(row, col)] = score
             
-            if score > best_score:
+            # below alpha a score is only a bound, it can't replace the first move
+            if score > best_score and (best_move is None or score > alpha):
                 best_score = score
                 best_move = (row, col)
-                # Early exit if found winning move
-                if score == float('inf'):
-                    break
+                self.root_best = (best_move, best_score)
             alpha = max(alpha, best_score)
             if alpha >= beta and use_alphabeta:
                 break
 
-        return best_move or random.choice(moves)
+        return best_move, best_score, scores
+
+    def aspiration_search(self, moves, depth, use_alphabeta, depth_scores):
+        # search_root, first with a window around the score of two depths
+        # back (the score swings between odd and even depths, as the side
+        # that moved last changes), widened on the side the score fell out
+        if (len(depth_scores) < 2 or not use_alphabeta or not self.use_pvs or self.workers > 1
+                or abs(depth_scores[-2]) >= 1_000_000):
+            return self.search_root(moves, depth, use_alphabeta)
+        width = self.aspiration_window
+        alpha, beta = depth_scores[-2] - width, depth_scores[-2] + width
+        while True:
+            result = self.search_root(moves, depth, use_alphabeta, (alpha, beta))
+            score = result[1]
+            if alpha < score < beta:
+                return result
+            self.stats.researches += 1
+            width *= 4
+            if score <= alpha:
+                alpha = score - width if abs(score) < 1_000_000 else float('-inf')
+            else:
+                beta = score + width if abs(score) < 1_000_000 else float('inf')
+
+    def iterative_deepening(self, moves, use_alphabeta, time_limit):
+        # Anytime search: depth 1, 2, 3, ... until time_limit seconds have
+        # passed (or the search is stopped), then play the best move of the
+        # last iteration that finished. The previous best move is searched
+        # first, so a better move from the unfinished iteration is kept too.
+        self.deadline = time.time() + time_limit
+        history_length = len(self.move_history)
+        best_move = None
+        depth_scores = []
+        if use_alphabeta:
+            moves = self.order_moves(moves, self.ai_player1, self.ai_player2, 0)
+        try:
+            for depth in range(1, self.size * self.size - self.stone_count + 1):
+                try:
+                    move, score, scores = self.aspiration_search(moves, depth, use_alphabeta, depth_scores)
+                except SearchTimeout:
+                    # Put back whatever the interrupted search left on the board
+                    self.undo_to(history_length)
+                    self.stats.interrupted = True
+                    best_move = self.root_best[0] or best_move
+                    break
+                best_move = move
+                depth_scores.append(score)
+                # A forced win (or loss) won't change by searching deeper
+                if abs(score) == 1_000_000:
+                    break
+                # Previous best first, the rest by their last score
+                moves = sorted(moves, key=lambda m: (m != best_move, -scores.get(m, float('-inf'))))
+        finally:
+            self.deadline = None
+        return best_move or moves[0]
+
+    def predict_reply(self):
+        # The human's expected answer to the AI's last move: the next move of
+        # the last principal variation, else the best move by move ordering
+        line = self.last_principal_variation
+        if (len(line) >= 2 and self.move_history and self.move_history[-1][:2] == line[0]
+                and self.board[line[1][0]][line[1][1]] == '.'):
+            return line[1]
+        moves = self.available_moves()
+        if not moves:
+            return None
+        return self.order_moves(moves, self.human_player, self.ai_player1, 0)[0]
+
+    def ponder(self, move, use_alphabeta=True):
+        # Plays the expected human move and deepens from there until
+        # self.deadline, so the transposition table and history scores are
+        # warm when get_ai_move is called. The board is restored afterwards.
+        history_length = len(self.move_history)
+        self.new_search()
+        try:
+            if not self.make_move(move[0], move[1], self.human_player) or self.game_over():
+                return
+            moves = self.available_moves()
+            if use_alphabeta:
+                moves = self.order_moves(moves, self.ai_player1, self.ai_player2, 0)
+            depth_scores = []
+            for depth in range(1, self.size * self.size - self.stone_count + 1):
+                best_move, score, scores = self.aspiration_search(moves, depth, use_alphabeta, depth_scores)
+                depth_scores.append(score)
+                if abs(score) == 1_000_000:
+                    break
+                moves = sorted(moves, key=lambda m: (m != best_move, -scores.get(m, float('-inf'))))
+        except SearchTimeout:
+            pass
+        finally:
+            self.undo_to(history_length)
+            self.deadline = None
+            self.stop_token = None
+
+    def start_ponder(self, use_alphabeta=True, time_limit=None):
+        # Ponders in a background thread on the human's time. The board
+        # belongs to that thread until stop_ponder() returns.
+        move = self.predict_reply()
+        if move is None or self.game_over():
+            return None
+        self.ponder_move = move
+        self.deadline = time.time() + (time_limit or self.ponder_time_limit)
+        self.ponder_stop = self.stop_token = threading.Event()
+        self.ponder_thread = threading.Thread(target=self.ponder, args=(move, use_alphabeta), daemon=True)
+        self.ponder_thread.start()
+        return move
+
+    def stop_ponder(self, actual_move=None):
+        # Cancels the ponder search (it stops within a few nodes) and waits for
+        # it to put the board back. Returns True if actual_move is the move
+        # that was pondered on.
+        if self.ponder_thread is None:
+            return False
+        self.ponder_stop.set()
+        self.ponder_thread.join()
+        self.ponder_thread = None
+        hit = actual_move is not None and tuple(actual_move) == self.ponder_move
+        self.ponder_move = None
+        return hit
+
+
+    def other_player(self, player):
+        return self.human_player if player == self.ai_player1 else self.ai_player1
+
+    def threat_space_search(self, player, max_plies=None, node_limit=None, time_limit=None):
+        """Look for a forced win for `player` (to move) that only uses fours
+        and open threes. Returns the winning line, starting with the move to
+        play, or None if none was found within the node and time limits."""
+        self.threat_nodes = 0
+        self.threat_node_budget = node_limit or self.threat_node_limit
+        if time_limit is None:
+            time_limit = self.threat_time_limit
+        self.threat_deadline = time.time() + time_limit
+        self.threat_failed = {}
+        start = time.time()
+        try:
+            # Deepen gradually so that short wins are found first
+            for plies in range(3, (max_plies or self.threat_max_plies) + 1, 2):
+                line = self.threat_attack(player, self.other_player(player), plies)
+                if line:
+                    return line
+            return None
+        except SearchTimeout:
+            return None
+        finally:
+            self.threat_deadline = None
+            self.stats.threat_nodes += self.threat_nodes
+            self.stats.threat_time += time.time() - start
+
+    def threat_attack(self, attacker, defender, plies_left):
+        # Attacker to move: try every four (one forced reply) and open three
+        # (a few defences, all of which must lose) that keeps the initiative
+        self.threat_nodes += 1
+        if self.threat_nodes > self.threat_node_budget or time.time() >= self.threat_deadline:
+            raise SearchTimeout()
+        if self.stop_token is not None and self.stop_token.is_set():
+            raise SearchTimeout()
+
+        wins = self.win_cells[attacker]
+        if wins:
+            return [divmod(min(wins), self.stride)]
+        # need at least: threat, reply, winning move
+        if plies_left < 3 or self.threat_failed.get(self.hash, -1) >= plies_left:
+            return None
 
+        fours = self.four_moves(attacker)
+        threes = {}
+        threats = self.win_cells[defender]
+        if threats:
+            # the defender threatens five: block it, and only with a four
+            if len(threats) > 1:
+                return None
+            block = divmod(next(iter(threats)), self.stride)
+            fours = [block] if block in fours else []
+        else:
+            threes = self.open_three_moves(attacker, defender)
+
+        for row, col in fours:
+            line = None
+            self.make_move(row, col, attacker)
+            try:
+                replies = self.win_cells[attacker]
+                if len(replies) > 1:
+                    # open four or double four, can't block both
+                    line = [(row, col)]
+                else:
+                    reply = divmod(next(iter(replies)), self.stride)
+                    self.make_move(reply[0], reply[1], defender)
+                    try:
+                        rest = self.threat_attack(attacker, defender, plies_left - 2)
+                    finally:
+                        self.undo_move(reply[0], reply[1])
+                    if rest:
+                        line = [(row, col), reply] + rest
+            finally:
+                self.undo_move(row, col)
+            if line:
+                return line
+
+        for (row, col), defences in threes.items():
+            line = None
+            self.make_move(row, col, attacker)
+            try:
+                # block the three, or counter with a four
+                for reply in sorted(defences.union(self.four_moves(defender))):
+                    self.make_move(reply[0], reply[1], defender)
+                    try:
+                        rest = self.threat_attack(attacker, defender, plies_left - 2)
+                    finally:
+                        self.undo_move(reply[0], reply[1])
+                    if not rest:
+                        line = None
+                        break
+                    if line is None:
+                        line = [(row, col), reply] + rest
+            finally:
+                self.undo_move(row, col)
+            if line:
+                return line
+
+        self.threat_failed[self.hash] = plies_left
+        return None
+
+    def four_moves(self, player):
+        # Empty cells that would give `player` four stones in an otherwise
+        # empty window, i.e. a threat to complete five next move
+        occupied = self.occupied_mask()
+        moves = set()
+        for window in self.three_windows[player]:
+            moves.update(self.bit_cells(self.windows[window] & ~occupied))
+        return sorted(moves)
+
+    def open_three_moves(self, attacker, defender):
+        # Moves that make an open three, mapped to the cells that defend it
+        stones = self.bitboards[attacker]
+        occupied = self.occupied_mask()
+        near = 0
+        for shift in self.shifts:
+            near |= (stones << shift) | (stones >> shift) | (stones << 2 * shift) | (stones >> 2 * shift)
+        alphabet = {attacker: 'x', defender: 'o', '.': '.'}
+        threes = {}
+        for row, col in self.bit_cells(near & self.board_mask & ~occupied):
+            index = row * self.stride + col
+            # needs at least two of its stones close by on the same lines
+            if (self.near_masks[index] & stones).bit_count() < 2:
+                continue
+            defences = set()
+            for line_index in self.cell_lines[index]:
+                cells = self.lines[line_index]
+                pos = cells.index((row, col))
+                # the patterns are six cells long
+                offset = max(0, pos - 5)
+                cells = cells[offset:pos + 6]
+                pos -= offset
+                chars = [alphabet[self.board[r][c]] for r, c in cells]
+                chars[pos] = 'x'
+                for match in self.open_three_re.finditer(''.join(chars)):
+                    start, pattern = match.start(), match.group(1)
+                    if start <= pos < start + len(pattern) and pattern[pos - start] == 'x':
+                        defences.update(cells[start + i] for i, ch in enumerate(pattern) if ch == '.')
+            if defences:
+                threes[(row, col)] = defences
+        return threes
+
+    def threat_defences(self, moves, line, deadline):
+        # The opponent has a forced win (line): keep the moves after which
+        # the solver can no longer find one. Cells of that line and our own
+        # fours are tried first; if nothing is found in time, keep all moves.
+        opponent = self.other_player(self.ai_player1)
+        first = set(line) | set(self.four_moves(self.ai_player1))
+        ordered = [m for m in moves if m in first] + [m for m in moves if m not in first]
+        defences = []
+        for row, col in ordered:
+            if time.time() >= deadline or (self.stop_token is not None and self.stop_token.is_set()):
+                break
+            self.make_move(row, col, self.ai_player1)
+            try:
+                found = self.threat_space_search(opponent, node_limit=self.threat_node_limit // 4,
+                                                 time_limit=deadline - time.time())
+            finally:
+                self.undo_move(row, col)
+            if found is None:
+                defences.append((row, col))
+        return defences or moves
 
    
     def choose_first_player(self):
@@ -342,88 +1850,91 @@ class Gomoku:
 
     def detect_threats(self, player):
         """Detect all potential threats for the given player"""
-        threats = []
-        directions = [(1, 0), (0, 1), (1, 1), (1, -1)]
-        
-        for row in range(self.size):
-            for col in range(self.size):
-                if self.board[row][col] == player:
-                    for di, dj in directions:
-                        # To avoid duplicate detection
-                        # Look at the cell just before the current one in the given direction.
-                        prev_i, prev_j = row - di, col - dj
-                        # If that previous cell is also the player's, we've already processed this sequence before — so skip it (to avoid duplication).
-                        if 0 <= prev_i < self.size and 0 <= prev_j < self.size and self.board[prev_i][prev_j] == player:
-                            continue
-                        
-                        length = 1
-                        ni, nj = row + di, col + dj
-                        while 0 <= ni < self.size and 0 <= nj < self.size and self.board[ni][nj] == player:
-                            length += 1
-                            ni += di
-                            nj += dj
-                        
-                        # at least 2 in row
-                        if length >= 2:  # Only consider sequences of 2 or more
-                            open_ends = 0
-                            
-                            # Check start of sequence
-                            start_i, start_j = row - di, col - dj
-                            if 0 <= start_i < self.size and 0 <= start_j < self.size and self.board[start_i][start_j] == '.':
-                                open_ends += 1
-                            
-                            # Check end of sequence
-                            end_i, end_j = row + di * length, col + dj * length
-                            if 0 <= end_i < self.size and 0 <= end_j < self.size and self.board[end_i][end_j] == '.':
-                                open_ends += 1
-                            
-                            if open_ends > 0:  # Only consider threats that can be extended
-                                threats.append({
-                                    'type': 'horizontal' if (di, dj) == (0, 1) else 
-                                           'vertical' if (di, dj) == (1, 0) else
-                                           'diagonal_down' if (di, dj) == (1, 1) else
-                                           'diagonal_up',
-                                    'start_row': row,
-                                    'start_col': col,
-                                    'length': length,
-                                    'open_ends': open_ends,
-                                    'direction': (di, dj)
-                                })
-        # length: the number of consecutive pieces
-        # open_ends: how many sides are open (can be extended).
-        # two threats are equal in length, we prefer the one with more open ends
-
-        # Sort threats by length and open ends
-        threats.sort(key=lambda x: (-x['length'], -x['open_ends']))
+        key = (self.hash, player)
+        threats = self.threat_cache.get(key)
+        if threats is None:
+            # Gathered from the threats cached for each line
+            found = [threat for i in self.threat_lines for threat in self.line_threats[i]
+                     if threat.player == player]
+            # Sort threats by length and open ends, then board position
+            found.sort(key=lambda threat: threat.key)
+            threats = tuple(found)
+            if len(self.threat_cache) >= self.cache_limit:
+                self.threat_cache.clear()
+            self.threat_cache[key] = threats
         return threats
 
+    def scan_line_threats(self, line_index):
+        # Threats of both players along one line: runs of two or more stones
+        # with an open end, and two runs split by one empty cell holding at
+        # least three stones (a split four counts even when closed, filling
+        # the gap wins).
+        cells = self.line_segment(line_index)
+        order = self.line_directions[line_index]
+        direction = self.directions[order]
+        line = [self.board[r][c] for r, c in cells]
+        n = len(line)
+        runs = []
+        i = 0
+        while i < n:
+            j = i + 1
+            while j < n and line[j] == line[i]:
+                j += 1
+            if line[i] != '.':
+                runs.append((line[i], i, j))
+            i = j
+
+        threats = []
+        for k, (player, start, end) in enumerate(runs):
+            # length: the number of consecutive pieces
+            # open_ends: how many sides are open (can be extended).
+            open_before = start > 0 and line[start - 1] == '.'
+            if end - start >= 2:
+                open_ends = open_before + (end < n and line[end] == '.')
+                if open_ends > 0:  # Only consider threats that can be extended
+                    threats.append(Threat(player, end - start, open_ends, cells[start], order, direction))
+            if k + 1 < len(runs):
+                # the next run, one empty cell further on
+                other, start2, end2 = runs[k + 1]
+                stones = end - start + end2 - start2
+                if other == player and start2 == end + 1 and stones >= 3:
+                    open_ends = open_before + (end2 < n and line[end2] == '.')
+                    if open_ends > 0 or stones >= self.winning_length - 1:
+                        threats.append(Threat(player, stones, open_ends, cells[start], order,
+                                              direction, cells[end]))
+        return tuple(threats)
+
     def get_blocking_moves(self, threats):
-        # best moves to block 
+        # best moves to block
         """Get the best blocking/attacking moves for given threats"""
-        blocking_moves = []
         # maps each move position to its threat score.
         # defaultdict sets it to 0
         move_scores = defaultdict(int)
-        
+
         for threat in threats:
-            di, dj = threat['direction']
-            row, col = threat['start_row'], threat['start_col']
-            length = threat['length']
-            
+            di, dj = threat.direction
+            row, col = threat.row, threat.col
+            # cells the shape covers, stones and gap
+            span = threat.length + (threat.gap is not None)
+
             # Score based on threat severity
-            threat_score = 10 ** (threat['length'] + threat['open_ends'])
-            
+            threat_score = 10 ** (threat.length + threat.open_ends)
+
+            # The gap joins the two runs, as urgent as an end of an open run
+            if threat.gap is not None:
+                move_scores[threat.gap] += 10 ** (threat.length + 2)
+
             # Check before the sequence
             # If the cell before the sequence is empty, it's a good move to block or extend → add its score.
             before_i, before_j = row - di, col - dj
             if 0 <= before_i < self.size and 0 <= before_j < self.size and self.board[before_i][before_j] == '.':
                 move_scores[(before_i, before_j)] += threat_score
-            
+
             # Check after the sequence
-            after_i, after_j = row + di * length, col + dj * length
+            after_i, after_j = row + di * span, col + dj * span
             if 0 <= after_i < self.size and 0 <= after_j < self.size and self.board[after_i][after_j] == '.':
                 move_scores[(after_i, after_j)] += threat_score
-        
+
         # Choose all moves with the highest score — these are the most urgent or useful.
         if move_scores:
             max_score = max(move_scores.values())
@@ -432,7 +1943,32 @@ class Gomoku:
 
 
 
-    def play_game(self):
+    def think(self, use_alphabeta, time_limit=None):
+        # get_ai_move in a helper thread, so that Ctrl-C stops the search
+        # cleanly (board put back) before it is passed on
+        stop = threading.Event()
+        result = []
+        worker = threading.Thread(target=lambda: result.append(self.get_ai_move(use_alphabeta, time_limit, stop=stop)),
+                                  daemon=True)
+        worker.start()
+        try:
+            while worker.is_alive():
+                worker.join(0.1)
+        except KeyboardInterrupt:
+            stop.set()
+            worker.join()
+            raise
+        return result[0]
+
+    def play_game(self, time_limit=None):
+        # time_limit: seconds per AI move, None = fixed depth. Type q or
+        # press Ctrl-C to quit.
+        try:
+            self.play_rounds(time_limit)
+        except (KeyboardInterrupt, EOFError):
+            print("\nGame stopped.")
+
+    def play_rounds(self, time_limit):
         choise=self.choose_game_option()
         if(choise):
             human_turn = self.choose_first_player()
@@ -442,7 +1978,11 @@ class Gomoku:
                 if human_turn:
                     while True:
                         try:
-                            row, col = map(int, input("Your move (row col): ").split())
+                            answer = input("Your move (row col, q to quit): ")
+                            if answer.strip().lower() == 'q':
+                                print("Game stopped.")
+                                return
+                            row, col = map(int, answer.split())
                             if self.make_move(row, col, self.human_player):
                                 break
                             print("Invalid move. Try again.")
@@ -451,7 +1991,7 @@ class Gomoku:
                 else:
                     print("\nAI's turn...")
                     start_time = time.time()
-                    row, col = self.get_ai_move(False)
+                    row, col = self.think(False, time_limit)
                     self.make_move(row, col, self.ai_player1)
                     print(f"AI moved to ({row}, {col}) in {time.time()-start_time:.2f}s")
                 
@@ -475,7 +2015,7 @@ class Gomoku:
                 if current_ai == 'alphabeta':
                     print("\n Player1's turn...")
                     start_time = time.time()
-                    row, col = self.get_ai_move(True)
+                    row, col = self.think(True, time_limit)
                     self.make_move(row, col, self.ai_player2)
                     print(f"AlphaBeta (X) moved to ({row}, {col}) in {time.time()-start_time:.2f}s")
                     current_ai = 'minimax'
@@ -483,7 +2023,7 @@ class Gomoku:
                 elif current_ai == 'minimax':
                     print("\n Player2's turn...")
                     start_time = time.time()
-                    row, col = self.get_ai_move(False)
+                    row, col = self.think(False, time_limit)
                     self.make_move(row, col, self.ai_player1)
                     print(f"Minimax (O) moved to ({row}, {col}) in {time.time()-start_time:.2f}s")
                     current_ai = 'alphabeta'
@@ -500,5 +2040,16 @@ class Gomoku:
 
 
 if __name__ == "__main__":
-    game = Gomoku()
-    game.play_game()        
+    parser = argparse.ArgumentParser(description="Play Gomoku in the terminal")
+    parser.add_argument('--time-limit', type=float, default=None,
+                        help="seconds per AI move (default: fixed depth)")
+    parser.add_argument('--book', help="opening book file (see gomoku_book.py)")
+    parser.add_argument('--size', type=int, default=15, help="board size (above 19 the board is sparse)")
+    parser.add_argument('--weights', help="pattern scores to play with (see gomoku_tune.py)")
+    args = parser.parse_args()
+    game = Gomoku(size=args.size)
+    if args.book:
+        game.open_book(args.book)
+    if args.weights:
+        game.load_pattern_scores(args.weights)
+    game.play_game(args.time_limit)        
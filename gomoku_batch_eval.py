@@ -0,0 +1,147 @@
+# Vectorized evaluate_board for many positions at once, e.g. every position
+# of a batch of game records:
+#
+#   evaluator = BatchEvaluator(Gomoku())
+#   scores = evaluator.evaluate(boards)      # boards: int8 (n, size, size)
+#
+# Cells are 0 (empty), 1 (the AI) and 2 (the human), see boards_to_array.
+# Scores are the same numbers evaluate_board gives for each position. Needs
+# NumPy, which the rest of the engine doesn't.
+import numpy as np
+
+EMPTY, AI, HUMAN, EDGE = 0, 1, 2, 3
+
+
+def boards_to_array(boards, ai_player, human_player):
+    # Lists of lists of 'X'/'O'/'.' (like Gomoku.board) -> int8 (n, size, size)
+    digits = {'.': EMPTY, ai_player: AI, human_player: HUMAN}
+    return np.array([[[digits[cell] for cell in row] for row in board] for board in boards],
+                    dtype=np.int8)
+
+
+class BatchEvaluator:
+    """Scores a stack of boards with the pattern tables of `game`.
+
+    Every line of the board (rows, columns, diagonals) becomes a row of cell
+    indices into the flattened board, padded with an edge cell, so the whole
+    batch is one (boards, lines, cells) array. Pattern windows are then
+    base-4 codes looked up in a table per pattern length, and human runs are
+    found with one pass over the cells of all lines together.
+    """
+
+    def __init__(self, game):
+        if game.sparse:
+            # every array here covers the whole board
+            raise ValueError("BatchEvaluator needs a dense board, use Gomoku(sparse=False)")
+        self.size = game.size
+        self.winning_length = game.winning_length
+        cells = self.size * self.size
+        longest = max(len(line) for line in game.lines)
+        # the extra cell at index `cells` is the edge of the board
+        self.line_cells = np.full((len(game.lines), longest), cells, dtype=np.intp)
+        for i, line in enumerate(game.lines):
+            self.line_cells[i, :len(line)] = [r * self.size + c for r, c in line]
+
+        # Same patterns as compile_pattern_tables, in base 4 so that windows
+        # running over the edge get a code of their own (always scoring 0)
+        digits = {'.': EMPTY, 'o': AI, 'x': HUMAN}
+        tables = {}
+        for pattern, value in game.pattern_scores.items():
+            if pattern in ('center', 'corner'):
+                continue  # Board-wide bonuses, handled separately
+            table = tables.setdefault(len(pattern), np.zeros(4 ** len(pattern), dtype=np.int64))
+            code = 0
+            for ch in pattern:
+                code = code * 4 + digits[ch]
+            table[code] += value
+        self.window_tables = sorted(tables.items())
+
+        self.center_bonus = np.array(game.center_bonus, dtype=np.int64).ravel()
+        self.corner_score = game.corner_score
+
+    def line_values(self, boards):
+        # (n, size, size) -> (n, lines, cells), padding cells set to EDGE
+        flat = boards.reshape(len(boards), -1)
+        padded = np.concatenate([flat, np.full((len(boards), 1), EDGE, dtype=flat.dtype)], axis=1)
+        return padded[:, self.line_cells].astype(np.int64)
+
+    def pattern_scores(self, values):
+        total = np.zeros(len(values), dtype=np.int64)
+        width = values.shape[2]
+        for length, table in self.window_tables:
+            if length > width:
+                continue
+            codes = np.zeros(values.shape[:2] + (width - length + 1,), dtype=np.int64)
+            for i in range(length):
+                codes = codes * 4 + values[:, :, i:width - length + 1 + i]
+            total += table[codes].sum(axis=(1, 2))
+        return total
+
+    def run_penalties(self, values):
+        # Same rules as Gomoku.run_penalty, for every run of human stones
+        total = np.zeros(len(values), dtype=np.int64)
+        run = np.zeros(values.shape[:2], dtype=np.int64)
+        open_before = np.zeros(values.shape[:2], dtype=bool)
+        previous = np.full(values.shape[:2], EDGE, dtype=np.int64)
+        for i in range(values.shape[2] + 1):
+            # one step past the last cell so that runs touching the end close
+            value = values[:, :, i] if i < values.shape[2] else np.full_like(previous, EDGE)
+            human = value == HUMAN
+            starts = human & (run == 0)
+            open_before = np.where(starts, previous == EMPTY, open_before)
+            ended = (run > 0) & ~human
+            open_ends = open_before.astype(np.int64) + (value == EMPTY)
+            penalty = np.where(run >= 3, -50000 * run,
+                               np.where((run == 2) & (open_ends == 2), -20000, 0))
+            total += np.where(ended & (open_ends > 0), penalty, 0).sum(axis=1)
+            run = np.where(human, run + 1, 0)
+            previous = value
+        return total
+
+    def winners(self, values):
+        # 1 where the AI has five in a row, -1 for the human, else 0 (a
+        # finished game has only one of them)
+        width = values.shape[2]
+        length = self.winning_length
+        result = np.zeros(len(values), dtype=np.int64)
+        for player, sign in ((HUMAN, -1), (AI, 1)):
+            stones = values == player
+            run = stones[:, :, :width - length + 1].copy()
+            for i in range(1, length):
+                run &= stones[:, :, i:width - length + 1 + i]
+            result[run.any(axis=(1, 2))] = sign
+        return result
+
+    def evaluate(self, boards):
+        """Scores of a stack of boards (int8 array, n x size x size)."""
+        boards = np.asarray(boards)
+        if boards.ndim == 2:
+            boards = boards[None]
+        values = self.line_values(boards)
+        scores = (self.corner_score
+                  + (boards.reshape(len(boards), -1) == AI) @ self.center_bonus
+                  + self.pattern_scores(values)
+                  + self.run_penalties(values))
+        winners = self.winners(values)
+        return np.where(winners == 0, scores, winners * 1_000_000)
+
+    def evaluate_children(self, game, moves, player):
+        # Scores of the positions after each of `moves` by `player`, like a
+        # loop of make_move / evaluate_board / undo_move
+        board = boards_to_array([game.board], game.ai_player1, game.human_player)[0]
+        boards = np.repeat(board[None], len(moves), axis=0)
+        digit = AI if player == game.ai_player1 else HUMAN
+        rows, cols = np.array(moves, dtype=np.intp).reshape(-1, 2).T
+        boards[np.arange(len(moves)), rows, cols] = digit
+        return self.evaluate(boards)
+
+    def evaluate_record(self, moves, first_player='X', ai_player='O'):
+        # Score after every ply of a game record (list of (row, col),
+        # first_player moving first), from ai_player's point of view
+        first = AI if first_player == ai_player else HUMAN
+        boards = np.zeros((len(moves), self.size, self.size), dtype=np.int8)
+        board = np.zeros((self.size, self.size), dtype=np.int8)
+        for ply, (row, col) in enumerate(moves):
+            board[row, col] = first if ply % 2 == 0 else AI + HUMAN - first
+            boards[ply] = board
+        return self.evaluate(boards)
@@ -0,0 +1,203 @@
+# Reproducible benchmarks for the engine's hot paths:
+#
+#   python gomoku_bench.py --output bench.json
+#
+# Runs over a fixed corpus of positions with a seeded RNG and writes the
+# results as JSON, so two commits can be compared run against run.
+from datetime import datetime, timezone
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import timeit
+
+from Gomoku import Gomoku
+
+# name -> (kind, moves), X plays first
+POSITIONS = {
+    'opening_center': ('opening', [(7, 7), (7, 8)]),
+    'opening_diagonal': ('opening', [(7, 7), (6, 8), (8, 8), (6, 6)]),
+    'midgame_open': ('midgame', [(7, 7), (7, 8), (9, 6), (6, 6), (8, 10), (5, 9)]),
+    'midgame_cluster': ('midgame', [(7, 7), (6, 8), (8, 8), (6, 6), (8, 6), (9, 9),
+                                    (7, 9), (5, 7), (8, 7), (8, 9)]),
+    'midgame_wide': ('midgame', [(7, 7), (8, 8), (6, 6), (9, 9), (5, 8), (6, 9),
+                                 (9, 5), (10, 4), (7, 10), (4, 7), (10, 8), (8, 11)]),
+    'tactical_four': ('tactical', [(7, 5), (7, 4), (7, 6), (11, 8), (7, 7), (0, 0),
+                                   (8, 8), (0, 1), (9, 8), (14, 14)]),
+    'tactical_threes': ('tactical', [(0, 0), (7, 6), (0, 2), (7, 7), (14, 14), (8, 9),
+                                     (14, 12), (9, 9)]),
+}
+
+
+def setup_position(moves, **options):
+    game = Gomoku(**options)
+    for i, (row, col) in enumerate(moves):
+        if not game.make_move(row, col, 'XO'[i % 2]):
+            raise ValueError(f"illegal move {(row, col)} in benchmark position")
+    return game
+
+
+def search_setup(moves, **settings):
+    # setup_position with some search settings changed, e.g. use_pvs=False
+    game = setup_position(moves)
+    for name, value in settings.items():
+        setattr(game, name, value)
+    return game
+
+
+def per_call_us(function, repeat=5, number=200):
+    # best of `repeat` runs, in microseconds per call
+    return min(timeit.repeat(function, repeat=repeat, number=number)) / number * 1e6
+
+
+def bench_calls(game, repeat):
+    row, col = divmod(min(game.candidates), game.stride) if game.candidates else (0, 0)
+
+    def make_undo():
+        game.make_move(row, col, game.ai_player1)
+        game.undo_move(row, col)
+
+    def detect_threats():
+        # with the cache emptied first, or it's only a dict lookup
+        game.threat_cache.clear()
+        game.detect_threats(game.human_player)
+
+    # (check_winner only reads the winner kept by make_move, scan_winner is
+    # the full-board check behind it)
+    return {
+        'evaluate_board': per_call_us(game.evaluate_board, repeat),
+        'available_moves': per_call_us(game.available_moves, repeat),
+        'scan_winner': per_call_us(game.scan_winner, repeat),
+        'detect_threats': per_call_us(detect_threats, repeat),
+        'make_undo_move': per_call_us(make_undo, repeat),
+    }
+
+
+def bench_search(game, max_depth, use_alphabeta, seed):
+    # Time to reach each depth with a plain iterative deepening (no time
+    # limit, no threat search), like get_ai_move(time_limit=...) does
+    random.seed(seed)
+    game.new_search()
+    moves = game.available_moves()
+    if use_alphabeta:
+        moves = game.order_moves(moves, game.ai_player1, game.ai_player2, 0)
+    depths = []
+    total_time = 0.0
+    depth_scores = []
+    for depth in range(1, max_depth + 1):
+        nodes_before = game.nodes
+        quiescence_before = game.stats.quiescence_nodes
+        leaves_before = game.stats.leaf_evaluations
+        start = time.perf_counter()
+        best_move, best_score, scores = game.aspiration_search(moves, depth, use_alphabeta, depth_scores)
+        elapsed = time.perf_counter() - start
+        total_time += elapsed
+        nodes = game.nodes - nodes_before
+        quiescence = game.stats.quiescence_nodes - quiescence_before
+        leaves = game.stats.leaf_evaluations - leaves_before
+        # every position visited: interior nodes, plus the quiescence nodes
+        # for pvs or the leaves for Alpha_Beta_pruning and minimax
+        positions = nodes + (quiescence or leaves)
+        depth_scores.append(best_score)
+        depths.append({
+            'depth': depth,
+            'seconds': elapsed,
+            'time_to_depth': total_time,
+            'nodes': nodes,
+            'quiescence_nodes': quiescence,
+            'leaf_evaluations': leaves,
+            'nodes_per_second': nodes / elapsed if elapsed else 0.0,
+            'positions_per_second': positions / elapsed if elapsed else 0.0,
+            'best_move': list(best_move) if best_move else None,
+            'score': best_score,
+        })
+        moves = sorted(moves, key=lambda m: (m != best_move, -scores.get(m, float('-inf'))))
+    return depths
+
+
+def bench_threats(game):
+    start = time.perf_counter()
+    line = game.threat_space_search(game.ai_player1)
+    return {
+        'seconds': time.perf_counter() - start,
+        'nodes': game.threat_nodes,
+        'line': [list(move) for move in line] if line else None,
+    }
+
+
+def check_pattern_tables(game):
+    # The lookup-table line scorer must agree with the regex reference
+    return all(game.score_line(i) == game.score_line_regex(game.line_string(i))
+               for i in range(len(game.lines)))
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(depth=4, repeat=5, seed=1234, minimax_depth=3, names=None):
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'seed': seed,
+            'depth': depth,
+            'minimax_depth': minimax_depth,
+        },
+        'positions': {},
+    }
+    for name, (kind, moves) in POSITIONS.items():
+        if names and name not in names:
+            continue
+        game = setup_position(moves)
+        entry = {
+            'kind': kind,
+            'stones': len(moves),
+            'pattern_tables_match': check_pattern_tables(game),
+            'calls_us': bench_calls(game, repeat),
+            'threat_search': bench_threats(game),
+            'alphabeta': bench_search(setup_position(moves), depth, True, seed),
+            # Alpha_Beta_pruning (use_pvs=False) and PVS without the quiescence
+            # stage, for node counts at the same depth
+            'alphabeta_plain': bench_search(search_setup(moves, use_pvs=False), depth, True, seed),
+            'pvs_no_quiescence': bench_search(search_setup(moves, quiescence_depth=0), depth, True, seed),
+            'minimax': bench_search(setup_position(moves), minimax_depth, False, seed),
+        }
+        results['positions'][name] = entry
+        last = entry['alphabeta'][-1]
+        plain = entry['alphabeta_plain'][-1]
+        print(f"{name:18} depth {last['depth']}: {last['time_to_depth']:7.3f}s "
+              f"{last['nodes']:7d}+{last['quiescence_nodes']}q nodes (plain {plain['nodes']})  "
+              f"{last['nodes_per_second']:6.0f} n/s {last['positions_per_second']:6.0f} pos/s "
+              f"(plain {plain['positions_per_second']:.0f})  "
+              f"eval {entry['calls_us']['evaluate_board']:.2f}us  "
+              f"moves {entry['calls_us']['available_moves']:.1f}us", file=sys.stderr)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Gomoku engine")
+    parser.add_argument('--output', '-o', help="write the JSON here (default: stdout)")
+    parser.add_argument('--depth', type=int, default=4, help="alpha-beta depth to reach")
+    parser.add_argument('--minimax-depth', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=5, help="timing repeats per call benchmark")
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--position', action='append', choices=sorted(POSITIONS),
+                        help="only these positions (can be repeated)")
+    args = parser.parse_args()
+    results = run_benchmarks(args.depth, args.repeat, args.seed, args.minimax_depth, args.position)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
@@ -0,0 +1,199 @@
+# Opening book: best moves for the first plies, computed offline and looked
+# up with a binary search over a memory-mapped file.
+#
+#   python gomoku_book.py build book.bin --plies 8 --width 2 --time-limit 2
+#   python gomoku_book.py show book.bin
+#
+# Positions are stored under the least of their 8 symmetric hashes (rotations
+# and mirror images), so one entry covers every orientation of an opening.
+# The file is a 16-byte header and then fixed-size records sorted by key;
+# being mmap'ed it costs no loading time and is shared between processes.
+import argparse
+import mmap
+import random
+import struct
+import sys
+import time
+
+from Gomoku import Gomoku
+
+MAGIC = b'GMKBOOK1'
+HEADER = struct.Struct('<8sHHI')    # magic, board size, unused, record count
+RECORD = struct.Struct('<QHh')      # position key, move (row * size + col), score / 100
+BOOK_SEED = 1505
+
+
+def symmetries(size):
+    # The 8 symmetries of the board as cell permutations: perm[s][i] is
+    # where cell i (row * size + col) goes under symmetry s
+    n = size - 1
+    maps = [
+        lambda r, c: (r, c), lambda r, c: (c, n - r), lambda r, c: (n - r, n - c), lambda r, c: (n - c, r),
+        lambda r, c: (r, n - c), lambda r, c: (n - r, c), lambda r, c: (c, r), lambda r, c: (n - c, n - r),
+    ]
+    perms = []
+    for transform in maps:
+        perm = [0] * (size * size)
+        for r in range(size):
+            for c in range(size):
+                tr, tc = transform(r, c)
+                perm[r * size + c] = tr * size + tc
+        perms.append(perm)
+    return perms
+
+
+class BookKeys:
+    """Hash keys of the book. They don't depend on the engine's own Zobrist
+    keys, so a book file stays valid when those change."""
+
+    def __init__(self, size):
+        self.size = size
+        keys = random.Random(BOOK_SEED * 1000 + size)
+        # stones of the side to move, then of its opponent
+        self.keys = [[keys.getrandbits(64) for _ in range(size * size)] for _ in range(2)]
+        self.perms = symmetries(size)
+        self.inverse = []
+        for perm in self.perms:
+            inverse = [0] * len(perm)
+            for i, j in enumerate(perm):
+                inverse[j] = i
+            self.inverse.append(inverse)
+
+    def stones(self, game, player):
+        # (0 for `player`'s stones or 1, cell index); keyed by who is to move
+        # rather than by X or O, as the engine may play either colour
+        return [(game.board[row][col] != player, row * self.size + col) for row, col, _ in game.move_history]
+
+    def canonical(self, stones):
+        # (key, symmetry) with the least key over the 8 symmetries
+        best = None
+        for s, perm in enumerate(self.perms):
+            key = 0
+            for player, index in stones:
+                key ^= self.keys[player][perm[index]]
+            if best is None or key < best[0]:
+                best = (key, s)
+        return best
+
+
+class OpeningBook:
+    """A book file opened read-only through mmap."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.size, _, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an opening book")
+        self.keys = BookKeys(self.size)
+
+    def close(self):
+        self.data.close()
+
+    def find(self, key):
+        # Binary search over the sorted records; (move, score) or None
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            found, move, score = RECORD.unpack_from(self.data, HEADER.size + middle * RECORD.size)
+            if found < key:
+                low = middle + 1
+            elif found > key:
+                high = middle
+            else:
+                return move, score * 100
+        return None
+
+    def lookup(self, game):
+        # The book move for the engine (ai_player1) in `game`, or None
+        if game.size != self.size:
+            return None
+        key, s = self.keys.canonical(self.keys.stones(game, game.ai_player1))
+        entry = self.find(key)
+        if entry is None:
+            return None
+        row, col = divmod(self.keys.inverse[s][entry[0]], self.size)
+        if game.board[row][col] != '.':
+            return None  # hash collision
+        return row, col
+
+    def __len__(self):
+        return self.count
+
+
+def write_book(path, size, entries):
+    # entries: {key: (move, score)}
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, size, 0, len(entries)))
+        for key in sorted(entries):
+            move, score = entries[key]
+            score = max(-32768, min(32767, round(score / 100)))
+            f.write(RECORD.pack(key, move, score))
+
+
+def build_book(path, plies=8, width=2, time_limit=2.0, size=15, max_positions=None, log=sys.stderr):
+    """Search every position reached in the first `plies` moves by playing
+    the best move and the next width - 1 moves by move ordering, and write
+    the best move of each to `path`."""
+    book_keys = BookKeys(size)
+    entries = {}
+    frontier = [[]]
+    start = time.time()
+    for ply in range(plies):
+        next_frontier = []
+        for moves in frontier:
+            player = 'XO'[len(moves) % 2]
+            game = Gomoku(ai_player=player, size=size)
+            for i, (row, col) in enumerate(moves):
+                game.make_move(row, col, 'XO'[i % 2])
+            if game.game_over():
+                continue
+            key, s = book_keys.canonical(book_keys.stones(game, player))
+            if key in entries:
+                continue
+            random.seed(key)
+            best = game.get_ai_move(True, time_limit=time_limit)
+            score = game.stats.score or 0
+            entries[key] = (book_keys.perms[s][best[0] * size + best[1]], score)
+            children = [best] + [move for move in game.order_moves(game.available_moves(), player,
+                                                                   game.other_player(player), 0)
+                                 if move != best][:width - 1]
+            next_frontier.extend(moves + [move] for move in children)
+            if max_positions and len(entries) >= max_positions:
+                break
+        print(f"ply {ply + 1}: {len(entries)} positions, {time.time() - start:.0f}s", file=log)
+        frontier = next_frontier
+        if max_positions and len(entries) >= max_positions:
+            break
+    write_book(path, size, entries)
+    return len(entries)
+
+
+def show_book(path):
+    book = OpeningBook(path)
+    print(f"{path}: {len(book)} positions, board {book.size}x{book.size}")
+    game = Gomoku(size=book.size)
+    start = time.perf_counter()
+    move = book.lookup(game)
+    print(f"empty board -> {move} ({(time.perf_counter() - start) * 1e6:.0f}us)")
+    book.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or inspect a Gomoku opening book")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help="search the openings and write a book")
+    build.add_argument('path')
+    build.add_argument('--plies', type=int, default=8)
+    build.add_argument('--width', type=int, default=2, help="moves followed from every position")
+    build.add_argument('--time-limit', type=float, default=2.0, help="seconds of search per position")
+    build.add_argument('--size', type=int, default=15)
+    build.add_argument('--max-positions', type=int, default=None)
+    show = commands.add_parser('show', help="print the size of a book and its first move")
+    show.add_argument('path')
+    args = parser.parse_args()
+    if args.command == 'build':
+        count = build_book(args.path, args.plies, args.width, args.time_limit, args.size, args.max_positions)
+        print(f"wrote {count} positions to {args.path}")
+    else:
+        show_book(args.path)
@@ -0,0 +1,195 @@
+# Long-running engine speaking the Gomocup text protocol on stdin/stdout,
+# for match servers and tournament managers that run it as a subprocess:
+#
+#   python gomoku_engine.py
+#
+# Coordinates are x,y = column,row from 0. In BOARD, field 1 is one of our
+# stones and 2 the opponent's. One Gomoku is kept for the whole process, so
+# its transposition table and line caches stay warm from game to game.
+# While searching, the engine writes MESSAGE lines with the depth, node
+# count, score and best move of every finished iteration.
+import argparse
+import sys
+import time
+
+from Gomoku import Gomoku
+
+ABOUT = 'name="Gomoku-Game", version="1.0"'
+
+
+class GomocupEngine:
+    """Handles one protocol command at a time and writes the replies to
+    `output`. The engine's stones are ai_player1, the opponent's human_player."""
+
+    def __init__(self, output=sys.stdout, workers=1, tt_size_mb=64, book_path=None):
+        self.output = output
+        self.workers = workers
+        self.tt_size_mb = tt_size_mb
+        self.book_path = book_path
+        self.game = None
+        # INFO values, in milliseconds; 0 = not limited
+        self.timeout_turn = 5000
+        self.timeout_match = 0
+        self.time_left = 0
+        # margin kept back from every time limit for the reply to get out
+        self.safety_ms = 100
+        self.board_lines = None  # moves collected while reading BOARD
+
+    def send(self, line):
+        self.output.write(line + '\n')
+        self.output.flush()
+
+    def run(self, stream=sys.stdin):
+        for line in stream:
+            if not self.handle(line):
+                break
+        if self.game is not None:
+            self.game.close()
+
+    def handle(self, line):
+        # Returns False after END
+        line = line.strip()
+        if not line:
+            return True
+        if self.board_lines is not None:
+            self.board_line(line)
+            return True
+        command, _, args = line.partition(' ')
+        command = command.upper()
+        if command == 'END':
+            return False
+        handler = getattr(self, 'cmd_' + command.lower(), None)
+        if handler is None:
+            self.send(f"UNKNOWN {command}")
+            return True
+        try:
+            handler(args.strip())
+        except ValueError as error:
+            self.send(f"ERROR {error}")
+        return True
+
+    def cmd_start(self, args):
+        size = int(args) if args else 15
+        if size < 5:
+            raise ValueError(f"unsupported board size {size}")
+        if self.game is None or self.game.size != size:
+            if self.game is not None:
+                self.game.close()
+            self.game = Gomoku(tt_size_mb=self.tt_size_mb, workers=self.workers, size=size)
+            self.game.add_search_hook(self.on_search_event)
+            if self.book_path:
+                self.game.open_book(self.book_path)
+        else:
+            self.clear_board()
+        self.send("OK")
+
+    def cmd_restart(self, args):
+        self.require_game()
+        self.clear_board()
+        self.send("OK")
+
+    def cmd_begin(self, args):
+        self.require_game()
+        self.play_move()
+
+    def cmd_turn(self, args):
+        self.require_game()
+        row, col = self.parse_move(args)
+        if not self.game.make_move(row, col, self.game.human_player):
+            raise ValueError(f"illegal move {args}")
+        self.play_move()
+
+    def cmd_takeback(self, args):
+        self.require_game()
+        row, col = self.parse_move(args)
+        if self.game.board[row][col] == '.':
+            raise ValueError(f"no stone at {args}")
+        self.game.undo_move(row, col)
+        self.send("OK")
+
+    def cmd_board(self, args):
+        self.require_game()
+        self.clear_board()
+        self.board_lines = []
+
+    def board_line(self, line):
+        if line.upper() != 'DONE':
+            self.board_lines.append(line)
+            return
+        lines, self.board_lines = self.board_lines, None
+        try:
+            for entry in lines:
+                x, y, field = (int(part) for part in entry.split(','))
+                player = self.game.ai_player1 if field == 1 else self.game.human_player
+                if not self.game.make_move(y, x, player):
+                    raise ValueError(f"illegal move {entry}")
+        except ValueError as error:
+            self.send(f"ERROR {error}")
+            return
+        self.play_move()
+
+    def cmd_info(self, args):
+        key, _, value = args.partition(' ')
+        key = key.lower()
+        if key in ('timeout_turn', 'timeout_match', 'time_left'):
+            setattr(self, key, int(value))
+        # other keys (max_memory, game_type, rule, folder) are not used
+
+    def cmd_about(self, args):
+        self.send(ABOUT)
+
+    def require_game(self):
+        if self.game is None:
+            raise ValueError("no game, send START first")
+
+    def clear_board(self):
+        # Take every stone back; the search tables are kept
+        self.game.undo_to(0)
+
+    def parse_move(self, text):
+        try:
+            x, y = (int(part) for part in text.split(','))
+        except ValueError:
+            raise ValueError(f"bad coordinates '{text}'")
+        if not (0 <= x < self.game.size and 0 <= y < self.game.size):
+            raise ValueError(f"coordinates out of range '{text}'")
+        return y, x
+
+    def time_limit(self):
+        # Seconds for this move: timeout_turn, and no more than a share of
+        # the match time left when the match is timed
+        limits = []
+        if self.timeout_turn > 0:
+            limits.append(self.timeout_turn)
+        if self.timeout_match > 0 and self.time_left > 0:
+            empty = self.game.size * self.game.size - self.game.stone_count
+            limits.append(self.time_left / max(10, empty // 4))
+        if not limits:
+            return None
+        return max(min(limits) - self.safety_ms, 10) / 1000
+
+    def play_move(self):
+        if self.game.game_over():
+            raise ValueError("the game is over")
+        start = time.time()
+        row, col = self.game.get_ai_move(True, self.time_limit())
+        self.game.make_move(row, col, self.game.ai_player1)
+        stats = self.game.stats
+        self.send(f"MESSAGE move {col},{row} reason {stats.reason} nodes {stats.nodes} "
+                  f"time {time.time() - start:.3f}s")
+        self.send(f"{col},{row}")
+
+    def on_search_event(self, event, stats, info):
+        if event == 'iteration':
+            move = info['move']
+            where = f"{move[1]},{move[0]}" if move else "-"
+            self.send(f"MESSAGE depth {info['depth']} nodes {stats.nodes} score {info['score']} move {where}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gomocup protocol engine on stdin/stdout")
+    parser.add_argument('--workers', type=int, default=1, help="processes for the root search")
+    parser.add_argument('--tt-size', type=int, default=64, help="transposition table size in MB")
+    parser.add_argument('--book', help="opening book file (see gomoku_book.py)")
+    args = parser.parse_args()
+    GomocupEngine(workers=args.workers, tt_size_mb=args.tt_size, book_path=args.book).run()
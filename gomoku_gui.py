@@ -1,20 +1,43 @@
 import tkinter as tk
 from tkinter import messagebox
+import argparse
+import queue
 import threading
-import time
 
 from Gomoku import Gomoku  # Assume your logic is saved in gomoku_core.py
 
 class GomokuGUI:
-    def __init__(self, root):
+    def __init__(self, root, size=15):
         self.root = root
-        self.game = Gomoku()
+        self.board_size = size
+        self.game = Gomoku(size=size)
         self.cell_size = 30
         self.margin = 20
         self.canvas_size = self.cell_size * self.game.size + 2 * self.margin
+        # Boards larger than view_cells are shown in a scrolled window
+        self.view_cells = 19
+        self.view_size = min(self.canvas_size, self.cell_size * self.view_cells + 2 * self.margin)
+        self.stone_radius = 10
         self.mode = None  # 'ai_vs_ai' or 'human_vs_ai'
+        # Human vs AI with the Monte Carlo tree search engine
+        self.use_mcts = False
         self.human_turn = True
+        # Engine moves come back from the worker threads through this queue;
+        # only the Tk main loop (poll_results) touches the board and canvas.
+        # Results of a game that was restarted meanwhile are dropped.
+        self.results = queue.Queue()
+        self.game_id = 0
+        self.poll_ms = 50
+        self.ai_delay_ms = 500
+        # search on the human's time (Human vs AI only)
+        self.ponder = True
+        # seconds per AI move, None = the engine's fixed depth
+        self.time_limit = None
+        # set to stop the running engine search (restart, quit)
+        self.search_stop = threading.Event()
+        self.root.protocol("WM_DELETE_WINDOW", self.quit)
         self.create_start_menu()
+        self.root.after(self.poll_ms, self.poll_results)
 
     def create_start_menu(self):
         self.clear_root()
@@ -30,12 +53,26 @@ class GomokuGUI:
                          command=lambda: self.start_game("ai_vs_ai"))
         btn2.pack(pady=10)
 
-    def start_game(self, mode):
+        btn3 = tk.Button(self.root, text="Human vs AI (MCTS)", font=("Arial", 14),
+                         command=lambda: self.start_game("human_vs_ai", use_mcts=True))
+        btn3.pack(pady=10)
+
+    def start_game(self, mode, use_mcts=False):
         self.mode = mode
+        self.use_mcts = use_mcts
         self.clear_root()
 
-        self.canvas = tk.Canvas(self.root, width=self.canvas_size, height=self.canvas_size, bg='#ffe6ff')
-        self.canvas.pack()
+        frame = tk.Frame(self.root)
+        frame.pack()
+        self.canvas = tk.Canvas(frame, width=self.view_size, height=self.view_size, bg='#ffe6ff',
+                                scrollregion=(0, 0, self.canvas_size, self.canvas_size))
+        if self.canvas_size > self.view_size:
+            xscroll = tk.Scrollbar(frame, orient=tk.HORIZONTAL, command=self.canvas.xview)
+            yscroll = tk.Scrollbar(frame, orient=tk.VERTICAL, command=self.canvas.yview)
+            self.canvas.configure(xscrollcommand=xscroll.set, yscrollcommand=yscroll.set)
+            yscroll.pack(side=tk.RIGHT, fill=tk.Y)
+            xscroll.pack(side=tk.BOTTOM, fill=tk.X)
+        self.canvas.pack(side=tk.LEFT)
 
         # 🎯 Add Restart Button
         restart_btn = tk.Button(self.root, text="Restart Game", font=("Arial", 12), command=self.restart_game)
@@ -43,11 +80,14 @@ class GomokuGUI:
 
         self.canvas.bind("<Button-1>", self.on_canvas_click)
         self.draw_board()
+        center = self.game.size // 2
+        self.show_cell(center, center)
 
         if mode == 'ai_vs_ai':
-            threading.Thread(target=self.ai_vs_ai_loop, daemon=True).start()
+            self.root.after(self.ai_delay_ms, self.start_ai_move, self.game_id, True, self.game.ai_player2)
 
     def draw_board(self):
+        # Grid once per game; after that stones are only added
         self.canvas.delete("all")
         for i in range(self.game.size):
             x0 = self.margin
@@ -60,53 +100,99 @@ class GomokuGUI:
             x = self.margin + i * self.cell_size
             self.canvas.create_line(x, y0, x, y1)
 
-        for r in range(self.game.size):
-            for c in range(self.game.size):
-                piece = self.game.board[r][c]
-                if piece != '.':
-                    x = self.margin + c * self.cell_size
-                    y = self.margin + r * self.cell_size
-                    color = 'black' if piece == 'X' else 'white'
-                    self.canvas.create_oval(x - 10, y - 10, x + 10, y + 10, fill=color)
+        for r, c, _ in self.game.move_history:
+            self.add_stone(r, c, self.game.board[r][c])
+
+    def show_cell(self, row, col):
+        # Scroll the view so that (row, col) is in it, centred if it was not
+        left, right = (self.canvas.canvasx(0), self.canvas.canvasx(self.view_size))
+        top, bottom = (self.canvas.canvasy(0), self.canvas.canvasy(self.view_size))
+        x = self.margin + col * self.cell_size
+        y = self.margin + row * self.cell_size
+        if not left + self.margin <= x <= right - self.margin:
+            self.canvas.xview_moveto((x - self.view_size / 2) / self.canvas_size)
+        if not top + self.margin <= y <= bottom - self.margin:
+            self.canvas.yview_moveto((y - self.view_size / 2) / self.canvas_size)
+
+    def add_stone(self, row, col, piece):
+        x = self.margin + col * self.cell_size
+        y = self.margin + row * self.cell_size
+        color = 'black' if piece == 'X' else 'white'
+        radius = self.stone_radius
+        self.canvas.create_oval(x - radius, y - radius, x + radius, y + radius, fill=color)
 
     def on_canvas_click(self, event):
-        if self.mode != 'human_vs_ai' or not self.human_turn or self.game.game_over():
+        if self.mode != 'human_vs_ai' or not self.human_turn:
             return
 
-        col = (event.x - self.margin) // self.cell_size
-        row = (event.y - self.margin) // self.cell_size
+        # event coordinates are in the window; the board may be scrolled
+        col = int(self.canvas.canvasx(event.x) - self.margin) // self.cell_size
+        row = int(self.canvas.canvasy(event.y) - self.margin) // self.cell_size
 
+        # The ponder search owns the board until it has stopped, so stop it
+        # before looking at the board at all
+        hit = self.game.stop_ponder((row, col))
+        if self.game.game_over():
+            return
         if self.game.make_move(row, col, self.game.human_player):
             self.human_turn = False
-            self.draw_board()
+            self.add_stone(row, col, self.game.human_player)
             self.check_game_end()
-
-            threading.Thread(target=self.ai_move_after_human, daemon=True).start()
-
-    def ai_move_after_human(self):
-        time.sleep(0.5)
-        if self.game.game_over():
+            if not self.game.game_over():
+                # the expected move was pondered on, no need to wait
+                delay = 0 if hit else self.ai_delay_ms
+                self.root.after(delay, self.start_ai_move, self.game_id, False, self.game.ai_player1)
+        elif self.ponder and not self.use_mcts:
+            self.game.start_ponder(False)
+
+    def start_ai_move(self, game_id, use_alphabeta, player):
+        # The search runs in a worker thread on this game; the board is left
+        # alone by the main loop until the result is back
+        if game_id != self.game_id or self.game.game_over():
             return
-        row, col = self.game.get_ai_move(False)
-        self.game.make_move(row, col, self.game.ai_player1)
-        self.draw_board()
-        self.check_game_end()
-        self.human_turn = True
-
-    def ai_vs_ai_loop(self):
-        current_ai = 'alphabeta'
-        while not self.game.game_over():
-            time.sleep(0.5)
-            if current_ai == 'alphabeta':
-                row, col = self.game.get_ai_move(True)
-                self.game.make_move(row, col, self.game.ai_player2)
-                current_ai = 'minimax'
+        self.search_stop = threading.Event()
+        threading.Thread(target=self.search_worker,
+                         args=(self.game_id, self.game, use_alphabeta, player, self.search_stop),
+                         daemon=True).start()
+
+    def search_worker(self, game_id, game, use_alphabeta, player, stop):
+        use_mcts = self.use_mcts and self.mode == 'human_vs_ai'
+        row, col = game.get_ai_move(use_alphabeta, self.time_limit, stop=stop, use_mcts=use_mcts)
+        self.results.put((game_id, row, col, player))
+
+    def stop_engine(self):
+        # Stop the running search and pondering; a stopped search still
+        # posts its move, which poll_results drops once game_id has changed
+        self.search_stop.set()
+        self.game.stop_ponder()
+
+    def poll_results(self):
+        try:
+            while True:
+                game_id, row, col, player = self.results.get_nowait()
+                if game_id == self.game_id:
+                    self.apply_ai_move(row, col, player)
+        except queue.Empty:
+            pass
+        self.root.after(self.poll_ms, self.poll_results)
+
+    def apply_ai_move(self, row, col, player):
+        self.game.make_move(row, col, player)
+        self.add_stone(row, col, player)
+        self.show_cell(row, col)
+        if self.game.game_over():
+            self.check_game_end()
+        elif self.mode == 'ai_vs_ai':
+            # Alpha-Beta plays ai_player2, Minimax ai_player1
+            if player == self.game.ai_player2:
+                self.root.after(self.ai_delay_ms, self.start_ai_move, self.game_id, False, self.game.ai_player1)
             else:
-                row, col = self.game.get_ai_move(False)
-                self.game.make_move(row, col, self.game.ai_player1)
-                current_ai = 'alphabeta'
-            self.draw_board()
-        self.check_game_end()
+                self.root.after(self.ai_delay_ms, self.start_ai_move, self.game_id, True, self.game.ai_player2)
+        else:
+            self.human_turn = True
+            # (the MCTS engine keeps its tree instead)
+            if self.ponder and not self.use_mcts:
+                self.game.start_ponder(False)
 
     def check_game_end(self):
         if self.game.game_over():
@@ -133,13 +219,24 @@ class GomokuGUI:
 
     def restart_game(self):
         if messagebox.askyesno("Restart", "Are you sure you want to restart?"):
-            self.game = Gomoku()
+            self.game_id += 1
+            self.stop_engine()
+            self.game = Gomoku(size=self.board_size)
             self.human_turn = True
             self.create_start_menu()
 
+    def quit(self):
+        self.game_id += 1
+        self.stop_engine()
+        self.game.close()
+        self.root.destroy()
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play Gomoku in a window")
+    parser.add_argument('--size', type=int, default=15, help="board size; large boards scroll")
+    args = parser.parse_args()
     root = tk.Tk()
     root.title("Gomoku")
-    gui = GomokuGUI(root)
+    gui = GomokuGUI(root, args.size)
     root.mainloop()
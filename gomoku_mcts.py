@@ -0,0 +1,377 @@
+# Monte Carlo tree search (PUCT) for Gomoku, used by get_ai_move(use_mcts=True).
+#
+# Nodes live in flat arrays indexed by node number instead of one Python
+# object each, and the children of a node are one contiguous block. The
+# tree is kept from move to move: the next search starts from the node of
+# the new position, and the part of the pool that is no longer reachable
+# is reclaimed by copying that subtree to the front. The pool never grows
+# past max_nodes; once it is full, leaves are only played out.
+#
+# Leaves are scored by playouts on a bytearray board: both sides play a
+# random cell next to a stone, except that a player with four in a row
+# completes it and otherwise blocks the opponent's. A playout that runs
+# past playout_limit moves (on a big board it may never end) is a draw.
+from array import array
+import math
+import random
+import time
+
+EMPTY, WALL = 0, 3
+
+
+class MCTS:
+    """A search tree for one Gomoku game, searched from game.board."""
+
+    def __init__(self, game, max_nodes=200_000, exploration=1.5, seed=None):
+        self.game = game
+        self.max_nodes = max_nodes
+        self.exploration = exploration
+        # win rate assumed for a child that has not been visited yet
+        self.first_play_value = 0.5
+        self.playout_limit = 150
+        self.rng = random.Random(seed)
+        # Playout board: the game's cell indices (row * stride + col, the
+        # spare column being a wall) moved down one row, with a row of wall
+        # above and below, so no step along a line runs off the array
+        stride = game.stride
+        self.offset = stride
+        self.steps = (1, stride, stride + 1, stride - 1)
+        self.neighbour_steps = (1, -1, stride, -stride, stride + 1, -stride - 1, stride - 1, -stride + 1)
+        self.template = bytearray([WALL]) * (stride * (game.size + 2))
+        for row in range(game.size):
+            start = self.offset + row * stride
+            self.template[start:start + game.size] = bytes(game.size)
+        self.reset()
+
+    def reset(self):
+        # An empty tree: just the root, at the position of the next search
+        self.allocate()
+        self.used = 1
+        self.root = 0
+        self.root_hash = None
+        self.root_player = None
+
+    def allocate(self):
+        n = self.max_nodes
+        self.move = array('i', [-1]) * n          # cell index of the move into the node
+        self.first_child = array('i', [-1]) * n   # -1 until expanded
+        self.child_count = array('i', [0]) * n
+        self.visits = array('i', [0]) * n
+        self.wins = array('d', [0.0]) * n         # for the player who made the move, draws count half
+        self.prior = array('f', [0.0]) * n
+        self.terminal = array('b', [0]) * n       # 1 the move won, 2 it filled the board
+
+    def children(self, node):
+        first = self.first_child[node]
+        return range(first, first + self.child_count[node]) if first >= 0 else range(0)
+
+    def other(self, player):
+        return 'X' if player == 'O' else 'O'
+
+    def find_root(self, player):
+        # Move the root to the current position if it is the old root or
+        # one or two moves below it; otherwise start a new tree
+        game = self.game
+        if self.root_hash is None:
+            self.start_tree(player)
+            return
+        if self.root_hash == game.hash and self.root_player == player:
+            return
+        keys = game.zobrist
+        first, second = self.root_player, self.other(self.root_player)
+        for child in self.children(self.root):
+            child_hash = self.root_hash ^ keys[first][self.move[child]]
+            if child_hash == game.hash and second == player:
+                self.move_root(child, player)
+                return
+            if first != player:
+                continue
+            for grandchild in self.children(child):
+                if child_hash ^ keys[second][self.move[grandchild]] == game.hash:
+                    self.move_root(grandchild, player)
+                    return
+        self.start_tree(player)
+
+    def start_tree(self, player):
+        self.reset()
+        self.root_hash = self.game.hash
+        self.root_player = player
+
+    def move_root(self, node, player):
+        self.root = node
+        self.root_hash = self.game.hash
+        self.root_player = player
+        if self.terminal[node]:
+            self.start_tree(player)
+        elif self.used > self.max_nodes // 2:
+            self.compact()
+
+    def compact(self):
+        # Copy the subtree under the root to the front of new arrays,
+        # children blocks staying contiguous
+        old = (self.move, self.first_child, self.child_count, self.visits, self.wins, self.prior, self.terminal)
+        old_move, old_first, old_count, old_visits, old_wins, old_prior, old_terminal = old
+        self.allocate()
+        pairs = [(self.root, 0)]
+        self.move[0] = old_move[self.root]
+        self.visits[0] = old_visits[self.root]
+        self.wins[0] = old_wins[self.root]
+        used = 1
+        for old_node, node in pairs:
+            first, count = old_first[old_node], old_count[old_node]
+            if first < 0:
+                continue
+            self.first_child[node] = used
+            self.child_count[node] = count
+            for k in range(count):
+                old_child, child = first + k, used + k
+                self.move[child] = old_move[old_child]
+                self.visits[child] = old_visits[old_child]
+                self.wins[child] = old_wins[old_child]
+                self.prior[child] = old_prior[old_child]
+                self.terminal[child] = old_terminal[old_child]
+                pairs.append((old_child, child))
+            used += count
+        self.root = 0
+        self.used = used
+
+    def expand(self, node, player, cells=None):
+        # Add the children of node, player to move; False if the pool is full.
+        # A player who can win only gets that move, one facing a four only
+        # the blocks; otherwise every cell next to a stone.
+        game = self.game
+        opponent = self.other(player)
+        if cells is None:
+            if game.win_cells[player]:
+                cells = [min(game.win_cells[player])]
+            elif game.win_cells[opponent]:
+                cells = list(game.win_cells[opponent])
+            else:
+                cells = list(game.candidates)
+        if not cells:
+            center = game.size // 2
+            cells = [center * game.stride + center]
+        if self.used + len(cells) > self.max_nodes:
+            return False
+        # prior: stones nearby along the lines, own counted double
+        own = game.bitboards.get(player, 0)
+        other = game.bitboards.get(opponent, 0)
+        weights = [(1 + 2 * (own & game.near_masks[cell]).bit_count()
+                    + (other & game.near_masks[cell]).bit_count()) ** 2 for cell in cells]
+        total = sum(weights)
+        first = self.used
+        for k, cell in enumerate(cells):
+            child = first + k
+            self.move[child] = cell
+            self.first_child[child] = -1
+            self.child_count[child] = 0
+            self.visits[child] = 0
+            self.wins[child] = 0.0
+            self.prior[child] = weights[k] / total
+            self.terminal[child] = 0
+        self.first_child[node] = first
+        self.child_count[node] = len(cells)
+        self.used += len(cells)
+        return True
+
+    def select(self, node, allowed=None):
+        # The child with the best PUCT score
+        visits, wins, prior, move = self.visits, self.wins, self.prior, self.move
+        scale = self.exploration * math.sqrt(visits[node] + 1)
+        best, best_score = -1, -1.0
+        for child in self.children(node):
+            if allowed is not None and move[child] not in allowed:
+                continue
+            n = visits[child]
+            value = wins[child] / n if n else self.first_play_value
+            score = value + scale * prior[child] / (1 + n)
+            if score > best_score:
+                best, best_score = child, score
+        return best
+
+    def play(self, node, player):
+        # Make the move into node on the game board and note if it ended the game
+        game = self.game
+        row, col = divmod(self.move[node], game.stride)
+        game.make_move(row, col, player)
+        if game.winner is not None:
+            self.terminal[node] = 1
+        elif game.is_board_full():
+            self.terminal[node] = 2
+
+    def iterate(self, player, allowed):
+        # One selection, expansion, playout and backup; returns the depth
+        game = self.game
+        history_length = len(game.move_history)
+        node = self.root
+        path = [node]
+        mover = player
+        try:
+            while self.first_child[node] >= 0:
+                child = self.select(node, allowed if node == self.root else None)
+                if child < 0:
+                    break
+                node = child
+                self.play(node, mover)
+                path.append(node)
+                mover = self.other(mover)
+                if self.terminal[node]:
+                    break
+            if self.terminal[node]:
+                winner = game.winner
+            else:
+                # a leaf is expanded on its second visit
+                if (self.visits[node] or node == self.root) and self.expand(node, mover):
+                    node = self.select(node)
+                    self.play(node, mover)
+                    path.append(node)
+                    mover = self.other(mover)
+                winner = game.winner if self.terminal[node] else self.playout(mover)
+        finally:
+            game.undo_to(history_length)
+
+        # who made the move into each node along the path
+        who = self.other(player)
+        for node in path:
+            self.visits[node] += 1
+            if winner is None:
+                self.wins[node] += 0.5
+            elif winner == who:
+                self.wins[node] += 1.0
+            who = self.other(who)
+        return len(path) - 1
+
+    def playout(self, player):
+        # Plays the game out from game.board, player first; returns the winner or None
+        game = self.game
+        board = self.template[:]
+        offset = self.offset
+        opponent = self.other(player)
+        for code, side in ((1, player), (2, opponent)):
+            stones = game.bitboards.get(side, 0)
+            while stones:
+                low = stones & -stones
+                board[offset + low.bit_length() - 1] = code
+                stones ^= low
+        candidates = [offset + cell for cell in game.candidates]
+        # cells that complete a four, per player code
+        urgent = [None, [], []]
+        random_value = self.rng.random
+        steps = self.steps
+        neighbour_steps = self.neighbour_steps
+        need = game.winning_length
+        code = 1
+        for _ in range(self.playout_limit):
+            other = 3 - code
+            cell = -1
+            for c in urgent[code]:
+                if board[c] == EMPTY:
+                    cell = c
+                    break
+            if cell < 0:
+                for c in urgent[other]:
+                    if board[c] == EMPTY:
+                        cell = c
+                        break
+            while cell < 0 and candidates:
+                i = int(random_value() * len(candidates))
+                c = candidates[i]
+                candidates[i] = candidates[-1]
+                candidates.pop()
+                if board[c] == EMPTY:
+                    cell = c
+            if cell < 0:
+                return None
+            board[cell] = code
+            for step in steps:
+                end = cell + step
+                while board[end] == code:
+                    end += step
+                start = cell - step
+                while board[start] == code:
+                    start -= step
+                run = (end - start) // step - 1
+                if run >= need:
+                    return player if code == 1 else opponent
+                if run == need - 1:
+                    if board[end] == EMPTY:
+                        urgent[code].append(end)
+                    if board[start] == EMPTY:
+                        urgent[code].append(start)
+            for step in neighbour_steps:
+                if board[cell + step] == EMPTY:
+                    candidates.append(cell + step)
+            code = other
+        return None
+
+    def search(self, player, moves=None, time_limit=None, iterations=2000):
+        """Best move for `player` (to move) by visit count, searching for
+        time_limit seconds if given and else for `iterations` playouts.
+        `moves` limits the root moves. Stops early on game.stop_token."""
+        game = self.game
+        start = time.time()
+        stats = game.stats
+        stride = game.stride
+        self.find_root(player)
+        allowed = None
+        if moves:
+            allowed = {row * stride + col for row, col in moves}
+            root = self.root
+            if not any(self.move[child] in allowed for child in self.children(root)):
+                self.first_child[root] = -1
+                self.expand(root, player, list(allowed))
+        deadline = start + time_limit if time_limit is not None else None
+        done = 0
+        while True:
+            if game.stop_token is not None and game.stop_token.is_set():
+                stats.interrupted = True
+                break
+            if deadline is not None and time.time() >= deadline:
+                break
+            if deadline is None and done >= iterations:
+                break
+            depth = self.iterate(player, allowed)
+            stats.count_node(depth)
+            stats.leaf_evaluations += 1
+            done += 1
+
+        best = self.best_child(self.root, allowed)
+        if best < 0:
+            return None
+        move = divmod(self.move[best], stride)
+        score = self.wins[best] / self.visits[best] if self.visits[best] else 0.5
+        stats.score = score
+        stats.principal_variation = self.principal_variation()
+        stats.iterations.append({
+            'depth': len(stats.principal_variation),
+            'seconds': time.time() - start,
+            'nodes': done,
+            'move': move,
+            'score': score,
+        })
+        if game.search_hooks:
+            game.emit('iteration', depth=len(stats.principal_variation), move=move, score=score)
+        return move
+
+    def best_child(self, node, allowed=None):
+        best, best_visits = -1, -1
+        for child in self.children(node):
+            if allowed is not None and self.move[child] not in allowed:
+                continue
+            if self.visits[child] > best_visits:
+                best, best_visits = child, self.visits[child]
+        return best
+
+    def root_counts(self):
+        # (cell index, visits, wins) of every root move searched
+        return [(self.move[child], self.visits[child], self.wins[child])
+                for child in self.children(self.root) if self.visits[child]]
+
+    def principal_variation(self, max_length=10):
+        # Most visited moves from the root down
+        line = []
+        node = self.best_child(self.root)
+        while node >= 0 and self.visits[node] and len(line) < max_length:
+            line.append(divmod(self.move[node], self.game.stride))
+            node = self.best_child(node)
+        return line
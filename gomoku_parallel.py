@@ -0,0 +1,201 @@
+# Parallel root search: the AI's root moves are shared out over a pool of
+# worker processes. Each worker keeps its own Gomoku (and transposition
+# table) between tasks and gets the position as two bitboard ints. The best
+# score found so far is kept in shared memory, so every worker starts its
+# next move with the best alpha any worker has found. A shared stop event
+# passes a stop request from the main process on to the workers.
+#
+# For Monte Carlo tree search every worker grows its own tree from the same
+# position (root parallelism) and the root visit counts are added up.
+from concurrent.futures import ProcessPoolExecutor, wait
+import multiprocessing
+import sys
+import time
+
+from Gomoku import Gomoku, SearchStats, SearchTimeout
+
+# set up once per worker process by init_worker
+worker_game = None
+worker_mcts = None
+shared_alpha = None
+
+
+def init_worker(alpha, stop, ai_player, size, pattern_scores=None):
+    global worker_game, shared_alpha
+    worker_game = Gomoku(ai_player=ai_player, size=size)
+    if pattern_scores is not None:
+        worker_game.set_pattern_scores(pattern_scores)
+    worker_game.stop_token = stop
+    shared_alpha = alpha
+
+
+def search_move(position, move, depth, use_alphabeta, deadline, search_id, use_pvs=True):
+    # Score one root move for the AI. Returns (move, score, nodes, stats),
+    # with score None if the deadline passed or the search was stopped first.
+    game = worker_game
+    game.load_position(position)
+    if search_id != getattr(game, 'search_id', None):
+        game.new_search()
+        game.search_id = search_id
+    game.nodes = 0
+    game.stats = SearchStats()
+    game.search_depth = depth
+    game.deadline = deadline
+    history_length = len(game.move_history)
+    row, col = move
+    game.make_move(row, col, game.ai_player1)
+    try:
+        if use_alphabeta and use_pvs:
+            score = -game.pvs(depth - 1, float('-inf'), -shared_alpha.value, False)
+        elif use_alphabeta:
+            score = game.Alpha_Beta_pruning(depth - 1, False, shared_alpha.value, float('inf'))
+        else:
+            score = game.minimax(depth - 1, False)
+    except SearchTimeout:
+        score = None
+    finally:
+        game.deadline = None
+        game.undo_to(history_length)
+    if score is not None and use_alphabeta:
+        with shared_alpha.get_lock():
+            if score > shared_alpha.value:
+                shared_alpha.value = score
+    return move, score, game.nodes, game.stats
+
+
+def search_mcts(position, player, moves, time_limit, iterations, max_nodes):
+    # Run this worker's tree search on the position. Returns the root
+    # (cell index, visits, wins) counts and the search stats.
+    global worker_mcts
+    game = worker_game
+    game.load_position(position)
+    game.stats = SearchStats()
+    if worker_mcts is None:
+        from gomoku_mcts import MCTS
+        worker_mcts = MCTS(game, max_nodes)
+    worker_mcts.search(player, moves, time_limit, iterations)
+    return worker_mcts.root_counts(), game.stats
+
+
+class RootSearchPool:
+    """Worker processes that split the root moves of a search between them."""
+
+    def __init__(self, workers, ai_player='O', size=15, pattern_scores=None):
+        self.workers = workers
+        self.alpha = multiprocessing.Value('d', float('-inf'))
+        self.stop = multiprocessing.Event()
+        self.executor = ProcessPoolExecutor(workers, initializer=init_worker,
+                                            initargs=(self.alpha, self.stop, ai_player, size, pattern_scores))
+
+    def search_root(self, game, moves, depth, use_alphabeta):
+        # Same result as Gomoku.search_root. Moves are handed out in order,
+        # so the most promising ones should come first.
+        with self.alpha.get_lock():
+            self.alpha.value = float('-inf')
+        self.stop.clear()
+        game.stats.count_node(0)
+        position = game.compact_position()
+        futures = [self.executor.submit(search_move, position, move, depth, use_alphabeta,
+                                        game.deadline, game.tt.generation, game.use_pvs)
+                   for move in moves]
+        # pass on a stop request from game.stop_token while waiting
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=0.05)
+            if game.stop_token is not None and game.stop_token.is_set():
+                self.stop.set()
+        best_move, best_score, scores = None, float('-inf'), {}
+        timed_out = False
+        for future in futures:
+            move, score, nodes, stats = future.result()
+            game.nodes += nodes
+            game.stats.merge(stats)
+            if score is None:
+                timed_out = True
+                continue
+            scores[move] = score
+            if score > best_score:
+                best_move, best_score = move, score
+                game.root_best = (best_move, best_score)
+        if timed_out:
+            raise SearchTimeout()
+        return best_move, best_score, scores
+
+    def search_mcts(self, game, moves, time_limit, iterations):
+        # Same result as game.mcts's search, from one tree per worker. A
+        # fixed number of iterations is split between the workers.
+        self.stop.clear()
+        position = game.compact_position()
+        per_worker = -(-iterations // self.workers)
+        start = time.time()
+        futures = [self.executor.submit(search_mcts, position, game.ai_player1, moves, time_limit,
+                                        per_worker, game.mcts_max_nodes)
+                   for _ in range(self.workers)]
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=0.05)
+            if game.stop_token is not None and game.stop_token.is_set():
+                self.stop.set()
+                game.stats.interrupted = True
+        visits, wins = {}, {}
+        for future in futures:
+            counts, stats = future.result()
+            game.stats.merge(stats)
+            for cell, n, w in counts:
+                visits[cell] = visits.get(cell, 0) + n
+                wins[cell] = wins.get(cell, 0.0) + w
+        if not visits:
+            return None
+        best = max(visits, key=visits.get)
+        move = divmod(best, game.stride)
+        score = wins[best] / visits[best]
+        game.stats.score = score
+        game.stats.iterations.append({
+            'depth': len(game.stats.nodes_per_ply) - 1,
+            'seconds': time.time() - start,
+            'nodes': game.stats.leaf_evaluations,
+            'move': move,
+            'score': score,
+        })
+        if game.search_hooks:
+            game.emit('iteration', depth=game.stats.iterations[-1]['depth'], move=move, score=score)
+        return move
+
+    def shutdown(self):
+        self.executor.shutdown(cancel_futures=True)
+
+
+def scaling_report(depth=4, worker_counts=(1, 2, 4, 8)):
+    # Time a fixed-depth alpha-beta root search on a few fixed midgame
+    # positions with each number of workers
+    positions = [
+        [(7, 7), (7, 8), (9, 6), (6, 6), (8, 10), (5, 9)],
+        [(7, 7), (6, 8), (8, 8), (6, 6), (8, 6), (9, 9)],
+        [(7, 7), (8, 7), (6, 8), (9, 6), (7, 9), (5, 6), (8, 9)],
+    ]
+    print(f"cpus: {multiprocessing.cpu_count()}  depth: {depth}")
+    baseline = None
+    for workers in worker_counts:
+        total_time = 0
+        total_nodes = 0
+        for moves in positions:
+            game = Gomoku(workers=workers)
+            for i, (row, col) in enumerate(moves):
+                game.make_move(row, col, 'XO'[i % 2])
+            root_moves = game.order_moves(game.available_moves(), game.ai_player1, game.ai_player2, 0)
+            if workers > 1:
+                # start the processes before timing
+                game.search_root(root_moves, 1, True)
+            game.new_search()
+            start = time.time()
+            game.search_root(root_moves, depth, True)
+            total_time += time.time() - start
+            total_nodes += game.nodes
+            game.close()
+        baseline = baseline or total_time
+        print(f"workers {workers}: {total_time:6.2f}s  {total_nodes:7d} nodes  "
+              f"speedup {baseline / total_time:4.2f}x")
+
+
+if __name__ == "__main__":
+    scaling_report(*(int(arg) for arg in sys.argv[1:2]))
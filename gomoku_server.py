@@ -0,0 +1,341 @@
+# Asyncio server hosting many human-vs-AI games at once:
+#
+#   python gomoku_server.py --port 8765 --workers 4
+#   python gomoku_server.py --unix /tmp/gomoku.sock
+#
+# Clients send one JSON object per line and get one JSON object back per
+# line, e.g.
+#
+#   {"op": "new", "human_first": true}          -> {"ok": true, "session": "..."}
+#   {"op": "move", "session": "...", "row": 7, "col": 7}
+#                                               -> {"ok": true, "ai_move": [7, 8], ...}
+#   {"op": "state", "session": "..."}  {"op": "close", "session": "..."}
+#   {"op": "stats"}                             -> request counts and latency percentiles
+#
+# An "id" in a request is copied into its reply. A session is just the list
+# of moves played; the engine runs in a fixed pool of worker processes, each
+# keeping one Gomoku per board size and colour. Move requests beyond
+# max_pending are refused with "busy" rather than queued without bound.
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import asyncio
+import json
+import secrets
+import sys
+import time
+import traceback
+
+from Gomoku import Gomoku
+
+# set up per worker process, (size, ai_player) -> Gomoku
+worker_games = {}
+# opening book of the worker processes; being mmap'ed, its pages are shared
+worker_book = None
+
+
+def init_worker(book_path):
+    global worker_book
+    if book_path:
+        from gomoku_book import OpeningBook
+        worker_book = OpeningBook(book_path)
+
+
+def engine_move(size, ai_player, moves, human_move, time_limit):
+    # Runs in a worker: set up the position from the move list (X first),
+    # play the human's move if there is one, then the AI's reply
+    started = time.time()
+    game = worker_games.get((size, ai_player))
+    if game is None:
+        game = worker_games[(size, ai_player)] = Gomoku(ai_player=ai_player, size=size)
+        game.book = worker_book
+    stones = {'X': 0, 'O': 0}
+    for i, index in enumerate(moves):
+        row, col = divmod(index, size)
+        stones['XO'[i % 2]] |= 1 << (row * game.stride + col)
+    game.load_position(tuple(stones.items()))
+
+    result = {'started': started, 'ai_move': None, 'nodes': 0, 'depth': 0}
+    if human_move is not None:
+        if not game.make_move(human_move[0], human_move[1], game.human_player):
+            result['error'] = "illegal move"
+            return result
+    if not game.game_over():
+        row, col = game.get_ai_move(True, time_limit)
+        game.make_move(row, col, game.ai_player1)
+        result['ai_move'] = (row, col)
+        result['nodes'] = game.stats.nodes
+        result['depth'] = game.stats.iterations[-1]['depth'] if game.stats.iterations else 0
+    result['winner'] = game.check_winner()
+    result['full'] = game.is_board_full()
+    result['engine_ms'] = (time.time() - started) * 1000
+    return result
+
+
+class Session:
+    """One game: its moves as cell indices (X first) and little else."""
+
+    __slots__ = ('size', 'ai_player', 'moves', 'finished', 'busy', 'last_used')
+
+    def __init__(self, size, ai_player):
+        self.size = size
+        self.ai_player = ai_player
+        self.moves = array('H')
+        self.finished = False
+        self.busy = False
+        self.last_used = time.time()
+
+    def human_player(self):
+        return 'X' if self.ai_player == 'O' else 'O'
+
+
+class RequestError(Exception):
+    """A request that can't be served; the message goes back to the client."""
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class GameServer:
+    def __init__(self, workers=2, max_pending=64, time_limit=1.0, max_time_limit=10.0,
+                 max_sessions=100_000, session_ttl=3600, history=10_000, book_path=None):
+        self.executor = ProcessPoolExecutor(workers, initializer=init_worker, initargs=(book_path,))
+        self.max_pending = max_pending
+        self.time_limit = time_limit
+        self.max_time_limit = max_time_limit
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl
+        self.sessions = {}
+        self.pending = 0
+        # (total, queued, engine) milliseconds of the latest move requests
+        self.latencies = deque(maxlen=history)
+        self.counts = {'requests': 0, 'moves': 0, 'busy': 0, 'timeouts': 0, 'errors': 0}
+
+    async def handle_client(self, reader, writer):
+        # Requests on one connection are answered in order
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                reply = await self.handle_line(line)
+                writer.write(json.dumps(reply).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle_line(self, line):
+        self.counts['requests'] += 1
+        request_id = None
+        try:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                raise RequestError("bad JSON")
+            if not isinstance(request, dict):
+                raise RequestError("expected a JSON object")
+            request_id = request.get('id')
+            handler = getattr(self, 'op_' + str(request.get('op')), None)
+            if handler is None:
+                raise RequestError(f"unknown op {request.get('op')!r}")
+            reply = await handler(request)
+            reply['ok'] = True
+        except RequestError as error:
+            self.counts['errors'] += 1
+            reply = {'ok': False, 'error': str(error)}
+        except Exception as error:
+            # an engine bug or a broken worker pool: the client still gets
+            # its reply and the connection stays up
+            self.counts['errors'] += 1
+            traceback.print_exc(file=sys.stderr)
+            reply = {'ok': False, 'error': f"internal error ({type(error).__name__})"}
+        if request_id is not None:
+            reply['id'] = request_id
+        return reply
+
+    def get_session(self, request):
+        session = self.sessions.get(request.get('session'))
+        if session is None:
+            raise RequestError("unknown session")
+        session.last_used = time.time()
+        return session
+
+    def request_time_limit(self, request):
+        try:
+            time_limit = float(request.get('time_limit', self.time_limit))
+        except (TypeError, ValueError):
+            raise RequestError("bad time_limit")
+        return min(max(time_limit, 0.01), self.max_time_limit)
+
+    async def op_new(self, request):
+        if len(self.sessions) >= self.max_sessions:
+            self.expire_sessions()
+            if len(self.sessions) >= self.max_sessions:
+                raise RequestError("too many sessions")
+        size = request.get('size', 15)
+        if not isinstance(size, int) or not 5 <= size <= 255:
+            raise RequestError("bad size")
+        human_first = request.get('human_first', True)
+        session = Session(size, 'O' if human_first else 'X')
+        session_id = secrets.token_hex(8)
+        self.sessions[session_id] = session
+        reply = {'session': session_id, 'human': session.human_player(), 'ai': session.ai_player}
+        if not human_first:
+            try:
+                reply.update(await self.play(session, None, self.request_time_limit(request)))
+            except Exception:
+                # no game without the AI's first move
+                del self.sessions[session_id]
+                raise
+        return reply
+
+    async def op_move(self, request):
+        session = self.get_session(request)
+        row, col = request.get('row'), request.get('col')
+        if not (isinstance(row, int) and isinstance(col, int)
+                and 0 <= row < session.size and 0 <= col < session.size):
+            raise RequestError("bad move")
+        if row * session.size + col in session.moves:
+            raise RequestError("illegal move")
+        return await self.play(session, (row, col), self.request_time_limit(request))
+
+    async def op_state(self, request):
+        session = self.get_session(request)
+        return {
+            'size': session.size,
+            'human': session.human_player(),
+            'moves': [divmod(index, session.size) for index in session.moves],
+            'finished': session.finished,
+        }
+
+    async def op_close(self, request):
+        self.get_session(request)
+        del self.sessions[request['session']]
+        return {}
+
+    async def op_stats(self, request):
+        totals = [total for total, queued, engine in self.latencies]
+        queued = [queued for total, queued, engine in self.latencies]
+        return {
+            'sessions': len(self.sessions),
+            'pending': self.pending,
+            'counts': dict(self.counts),
+            'latency_ms': {name: percentile(totals, fraction)
+                           for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1.0))},
+            'queued_ms': {name: percentile(queued, fraction)
+                          for name, fraction in (('p50', 0.5), ('p99', 0.99))},
+        }
+
+    async def play(self, session, human_move, time_limit):
+        # Sends the move to the engine pool. A session has at most one move
+        # in flight, and at most max_pending moves wait for the pool.
+        if session.finished:
+            raise RequestError("game is over")
+        if session.busy:
+            raise RequestError("a move for this session is already being played")
+        if self.pending >= self.max_pending:
+            self.counts['busy'] += 1
+            raise RequestError("busy")
+        session.busy = True
+        self.pending += 1
+        submitted = time.time()
+
+        def release(future):
+            # The slot is given back once the pool is really done with the
+            # job, not when the request gives up waiting for it
+            session.busy = False
+            self.pending -= 1
+            if not future.cancelled():
+                future.exception()
+
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(self.executor, engine_move, session.size, session.ai_player,
+                                          session.moves, human_move, time_limit)
+        except BaseException:
+            session.busy = False
+            self.pending -= 1
+            raise
+        future.add_done_callback(release)
+        # the engine keeps to time_limit itself; the rest is queueing
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), time_limit * 2 + 5)
+        except asyncio.TimeoutError:
+            self.counts['timeouts'] += 1
+            raise RequestError("timed out")
+        if 'error' in result:
+            raise RequestError(result['error'])
+
+        if human_move is not None:
+            session.moves.append(human_move[0] * session.size + human_move[1])
+        if result['ai_move'] is not None:
+            session.moves.append(result['ai_move'][0] * session.size + result['ai_move'][1])
+        session.finished = result['winner'] is not None or result['full']
+        total_ms = (time.time() - submitted) * 1000
+        queued_ms = max(0.0, (result['started'] - submitted) * 1000)
+        self.latencies.append((total_ms, queued_ms, result['engine_ms']))
+        self.counts['moves'] += 1
+        return {
+            'ai_move': result['ai_move'],
+            'winner': result['winner'],
+            'finished': session.finished,
+            'depth': result['depth'],
+            'nodes': result['nodes'],
+            'latency_ms': round(total_ms, 2),
+            'queued_ms': round(queued_ms, 2),
+        }
+
+    def expire_sessions(self):
+        cutoff = time.time() - self.session_ttl
+        for session_id in [key for key, session in self.sessions.items()
+                           if session.last_used < cutoff and not session.busy]:
+            del self.sessions[session_id]
+
+    async def expire_loop(self):
+        while True:
+            await asyncio.sleep(max(1, self.session_ttl / 4))
+            self.expire_sessions()
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+
+async def serve(server, host='127.0.0.1', port=8765, unix_path=None):
+    if unix_path:
+        listener = await asyncio.start_unix_server(server.handle_client, unix_path)
+    else:
+        listener = await asyncio.start_server(server.handle_client, host, port)
+    expiry = asyncio.create_task(server.expire_loop())
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        expiry.cancel()
+        server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi-game Gomoku server (JSON lines)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help="listen on this Unix socket instead of TCP")
+    parser.add_argument('--workers', type=int, default=2, help="engine processes")
+    parser.add_argument('--max-pending', type=int, default=64, help="move requests in flight before 'busy'")
+    parser.add_argument('--time-limit', type=float, default=1.0, help="default seconds per AI move")
+    parser.add_argument('--max-time-limit', type=float, default=10.0)
+    parser.add_argument('--session-ttl', type=float, default=3600, help="seconds before an idle game is dropped")
+    parser.add_argument('--book', help="opening book file (see gomoku_book.py)")
+    args = parser.parse_args()
+    game_server = GameServer(args.workers, args.max_pending, args.time_limit, args.max_time_limit,
+                             session_ttl=args.session_ttl, book_path=args.book)
+    try:
+        asyncio.run(serve(game_server, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
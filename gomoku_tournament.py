@@ -0,0 +1,188 @@
+# Headless self-play tournament between two engines, e.g. to check that an
+# engine change doesn't cost strength or speed:
+#
+#   python gomoku_tournament.py --games 40 --workers 4 --time-limit 0.5
+#
+# Games are played in parallel worker processes with nothing printed or drawn
+# per move. Every opening is played twice with the colors swapped.
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import math
+import random
+import time
+
+from Gomoku import Gomoku
+
+BOARD_SIZE = 15
+
+# name -> function(game, time_limit) returning the engine's move for
+# game.ai_player1
+ENGINES = {
+    'alphabeta': lambda game, time_limit: game.get_ai_move(True, time_limit=time_limit),
+    'minimax': lambda game, time_limit: game.get_ai_move(False, time_limit=time_limit),
+}
+
+# Opening stones as (row, col) offsets from the center, X first
+BOOK_OPENINGS = [
+    [(0, 0), (-1, 0), (-2, 0)],
+    [(0, 0), (-1, 0), (-2, 1)],
+    [(0, 0), (-1, 0), (-1, 1)],
+    [(0, 0), (-1, 0), (0, 1)],
+    [(0, 0), (-1, 0), (-2, 2)],
+    [(0, 0), (-1, 1), (-2, 2)],
+    [(0, 0), (-1, 1), (-2, 0)],
+    [(0, 0), (-1, 1), (0, 2)],
+    [(0, 0), (-1, 1), (-1, 2)],
+    [(0, 0), (-1, 1), (1, 1)],
+]
+
+
+def random_opening(rng, size, plies=3, spread=2):
+    # `plies` random stones within `spread` of the center, X first
+    center = size // 2
+    cells = [(center + dr, center + dc)
+             for dr in range(-spread, spread + 1) for dc in range(-spread, spread + 1)]
+    return rng.sample(cells, plies)
+
+
+def play_one_game(engine_x, engine_o, opening, time_limit, depth, seed):
+    # Plays one game and returns the winner ('X', 'O' or None for a draw),
+    # the number of stones and each side's think time and move count
+    random.seed(seed)
+    games = {'X': Gomoku(ai_player='X'), 'O': Gomoku(ai_player='O')}
+    engines = {'X': engine_x, 'O': engine_o}
+    for game in games.values():
+        if depth:
+            game.max_depth = depth
+
+    player = 'X'
+    for row, col in opening:
+        for game in games.values():
+            game.make_move(row, col, player)
+        player = 'O' if player == 'X' else 'X'
+
+    think_time = {'X': 0.0, 'O': 0.0}
+    move_count = {'X': 0, 'O': 0}
+    while not games['X'].game_over():
+        start = time.perf_counter()
+        row, col = ENGINES[engines[player]](games[player], time_limit)
+        think_time[player] += time.perf_counter() - start
+        move_count[player] += 1
+        for game in games.values():
+            if not game.make_move(row, col, player):
+                raise RuntimeError(f"{engines[player]} played an illegal move {(row, col)}")
+        player = 'O' if player == 'X' else 'X'
+
+    return {
+        'x': engine_x,
+        'o': engine_o,
+        'winner': games['X'].check_winner(),
+        'stones': games['X'].stone_count,
+        'time': think_time,
+        'moves': move_count,
+    }
+
+
+def elo(score):
+    if score <= 0:
+        return float('-inf')
+    if score >= 1:
+        return float('inf')
+    return -400 * math.log10(1 / score - 1)
+
+
+def elo_difference(wins, draws, losses, z=1.96):
+    # Elo difference and its confidence interval (95% by default): a Wilson
+    # interval on the mean game score, which stays sensible for a
+    # whitewash where the sample variance is zero. Scores are kept about
+    # half a game away from 0 and 1 so that every number is finite.
+    games = wins + draws + losses
+    score = (wins + draws / 2) / games
+    spread = z * z / games
+    center = (score + spread / 2) / (1 + spread)
+    margin = z * math.sqrt(score * (1 - score) / games + spread / (4 * games)) / (1 + spread)
+    limit = 0.5 / (games + 1)
+
+    def clamped(value):
+        return min(max(value, limit), 1 - limit)
+
+    return elo(clamped(score)), elo(clamped(center - margin)), elo(clamped(center + margin))
+
+
+def run_tournament(engine_a='alphabeta', engine_b='minimax', games=20, workers=None,
+                   time_limit=None, depth=None, openings='random', seed=0):
+    """Play `games` games between engine_a and engine_b and return the
+    result counts, Elo difference (from engine_a's side) and move times."""
+    rng = random.Random(seed)
+    tasks = []
+    for pair in range((games + 1) // 2):
+        if openings == 'book':
+            center = BOARD_SIZE // 2
+            opening = [(center + dr, center + dc) for dr, dc in BOOK_OPENINGS[pair % len(BOOK_OPENINGS)]]
+        else:
+            opening = random_opening(rng, BOARD_SIZE)
+        tasks.append((engine_a, engine_b, opening, time_limit, depth, seed * 100003 + 2 * pair))
+        tasks.append((engine_b, engine_a, opening, time_limit, depth, seed * 100003 + 2 * pair + 1))
+    tasks = tasks[:games]
+
+    start = time.time()
+    with ProcessPoolExecutor(workers) as executor:
+        results = list(executor.map(play_one_game, *zip(*tasks)))
+    elapsed = time.time() - start
+
+    wins = draws = losses = 0
+    think_time = {engine_a: 0.0, engine_b: 0.0}
+    move_count = {engine_a: 0, engine_b: 0}
+    for result in results:
+        by_color = {'X': result['x'], 'O': result['o']}
+        if result['winner'] is None:
+            draws += 1
+        elif by_color[result['winner']] == engine_a:
+            wins += 1
+        else:
+            losses += 1
+        for color, engine in by_color.items():
+            think_time[engine] += result['time'][color]
+            move_count[engine] += result['moves'][color]
+
+    diff, low, high = elo_difference(wins, draws, losses)
+    return {
+        'engines': (engine_a, engine_b),
+        'games': len(results),
+        'wins': wins,
+        'draws': draws,
+        'losses': losses,
+        'elo': diff,
+        'elo_interval': (low, high),
+        'ms_per_move': {engine: 1000 * think_time[engine] / move_count[engine] if move_count[engine] else 0.0
+                        for engine in think_time},
+        'average_stones': sum(result['stones'] for result in results) / len(results),
+        'seconds': elapsed,
+    }
+
+
+def print_report(report):
+    engine_a, engine_b = report['engines']
+    low, high = report['elo_interval']
+    print(f"{engine_a} vs {engine_b}: {report['games']} games in {report['seconds']:.1f}s")
+    print(f"  +{report['wins']} ={report['draws']} -{report['losses']}  "
+          f"(win/draw/loss for {engine_a})")
+    print(f"  Elo difference: {report['elo']:+.0f}  (95% interval {low:+.0f} .. {high:+.0f})")
+    for engine, ms in report['ms_per_move'].items():
+        print(f"  {engine}: {ms:.1f} ms per move")
+    print(f"  average game length: {report['average_stones']:.1f} stones")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless Gomoku engine tournament")
+    parser.add_argument('--engine-a', default='alphabeta', choices=sorted(ENGINES))
+    parser.add_argument('--engine-b', default='minimax', choices=sorted(ENGINES))
+    parser.add_argument('--games', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=None, help="processes (default: one per CPU)")
+    parser.add_argument('--time-limit', type=float, default=None, help="seconds per move (default: fixed depth)")
+    parser.add_argument('--depth', type=int, default=None, help="fixed search depth (default: the engine's max_depth)")
+    parser.add_argument('--openings', choices=['random', 'book'], default='random')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    print_report(run_tournament(args.engine_a, args.engine_b, args.games, args.workers,
+                                args.time_limit, args.depth, args.openings, args.seed))
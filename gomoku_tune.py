@@ -0,0 +1,286 @@
+# Tuning pattern_scores on self-play games (Texel method): fit the weights
+# so that a logistic of the evaluation predicts the game results.
+#
+#   python gomoku_tune.py selfplay games.gmr --games 500 --workers 4 --time-limit 0.2
+#   python gomoku_tune.py tune games.gmr --epochs 20 --out weights.json
+#   python Gomoku.py --weights weights.json
+#
+# A record file is the 8-byte MAGIC followed by games, each a GAME header
+# (board size, result, number of moves) and the moves as cell indices
+# (row * size + col) of one byte each, two for boards above 16x16 and four
+# above 256x256. Games of different board sizes can share a file.
+# Games are read one at a time and the positions turned into feature
+# matrices chunk_size positions at a time, so memory stays the same
+# whatever the size of the record set; every epoch reads the files again.
+# Needs NumPy, like gomoku_batch_eval.
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import json
+import random
+import struct
+import sys
+import time
+
+import numpy as np
+
+from Gomoku import Gomoku
+from gomoku_batch_eval import AI, HUMAN, BatchEvaluator
+from gomoku_tournament import random_opening
+
+MAGIC = b'GMKREC2\n'
+GAME = struct.Struct('<HbI')   # board size, result (1 X won, -1 O won, 0 draw), moves
+MAX_SIZE = 2 ** 16 - 1
+
+
+def cell_format(size):
+    # struct code of one move on a size x size board
+    return 'B' if size <= 16 else 'H' if size <= 256 else 'I'
+
+
+def write_game(f, size, result, moves):
+    f.write(GAME.pack(size, result, len(moves)))
+    cells = [row * size + col for row, col in moves]
+    f.write(struct.pack(f'<{len(cells)}{cell_format(size)}', *cells))
+
+
+def read_games(path):
+    # Yields (size, result, moves) for every game in a record file
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a game record file")
+        while True:
+            header = f.read(GAME.size)
+            if len(header) < GAME.size:
+                return
+            size, result, count = GAME.unpack(header)
+            cells = struct.Struct(f'<{count}{cell_format(size)}')
+            data = f.read(cells.size)
+            if len(data) < cells.size:
+                raise ValueError(f"{path}: truncated game record")
+            yield size, result, [divmod(cell, size) for cell in cells.unpack(data)]
+
+
+def self_play_game(size, time_limit, opening_plies, seed):
+    # One engine-vs-engine game from a random opening; (result, moves)
+    rng = random.Random(seed)
+    random.seed(seed)
+    games = {'X': Gomoku(ai_player='X', size=size), 'O': Gomoku(ai_player='O', size=size)}
+    moves = random_opening(rng, size, opening_plies)
+    player = 'X'
+    for row, col in moves:
+        for game in games.values():
+            game.make_move(row, col, player)
+        player = 'O' if player == 'X' else 'X'
+    while not games['X'].game_over():
+        row, col = games[player].get_ai_move(True, time_limit=time_limit)
+        for game in games.values():
+            game.make_move(row, col, player)
+        moves.append((row, col))
+        player = 'O' if player == 'X' else 'X'
+    winner = games['X'].check_winner()
+    return {'X': 1, 'O': -1, None: 0}[winner], moves
+
+
+def self_play(path, games, size=15, time_limit=0.2, opening_plies=4, workers=1, seed=None, log=sys.stderr):
+    """Plays `games` games and appends them to the record file at `path`."""
+    if not 5 <= size <= MAX_SIZE:
+        raise ValueError(f"board size {size} out of range (5 to {MAX_SIZE})")
+    rng = random.Random(seed)
+    seeds = [rng.getrandbits(32) for _ in range(games)]
+    with open(path, 'ab') as f:
+        if f.tell() == 0:
+            f.write(MAGIC)
+        with ProcessPoolExecutor(workers) as executor:
+            results = executor.map(self_play_game, [size] * games, [time_limit] * games,
+                                   [opening_plies] * games, seeds)
+            for n, (result, moves) in enumerate(results, 1):
+                write_game(f, size, result, moves)
+                f.flush()
+                print(f"game {n}/{games}: {len(moves)} moves, result {result:+d}", file=log)
+
+
+class PatternFeatures:
+    """Pattern counts of positions as a feature matrix, one column per group
+    of patterns (a pattern and its mirror image share one weight), plus the
+    part of the evaluation that is not tuned (center, corners, run penalties).
+    Boards of any size are taken, each size with an evaluator of its own."""
+
+    def __init__(self, game):
+        self.game_scores = dict(game.pattern_scores)
+        self.ai_player = game.ai_player1
+        self.evaluators = {}
+        digits = {'.': 0, 'o': AI, 'x': HUMAN}
+        self.groups = []
+        for pattern in game.pattern_scores:
+            if pattern in ('center', 'corner'):
+                continue
+            if pattern[::-1] in game.pattern_scores and pattern[::-1] < pattern:
+                continue  # grouped with its mirror image
+            self.groups.append(sorted({pattern, pattern[::-1]} & game.pattern_scores.keys()))
+        # per pattern length, a table from the base-4 window code (like
+        # BatchEvaluator's tables) to the group's column, -1 for no pattern
+        self.columns = {}
+        for k, group in enumerate(self.groups):
+            for pattern in group:
+                table = self.columns.setdefault(len(pattern), np.full(4 ** len(pattern), -1, dtype=np.intp))
+                code = 0
+                for ch in pattern:
+                    code = code * 4 + digits[ch]
+                table[code] = k
+
+    def weights(self, pattern_scores):
+        # One weight per group (mirror images averaged)
+        return np.array([np.mean([pattern_scores[p] for p in group]) for group in self.groups])
+
+    def pattern_scores(self, weights):
+        return {pattern: int(round(weight)) for group, weight in zip(self.groups, weights) for pattern in group}
+
+    def evaluator(self, size):
+        # BatchEvaluator of a dense size x size game with our pattern_scores
+        if size not in self.evaluators:
+            game = Gomoku(ai_player=self.ai_player, size=size, sparse=False)
+            game.set_pattern_scores(self.game_scores)
+            self.evaluators[size] = BatchEvaluator(game)
+        return self.evaluators[size]
+
+    def features(self, boards):
+        # (n, size, size) boards -> (counts (n, groups), fixed score (n,))
+        evaluator = self.evaluator(boards.shape[1])
+        values = evaluator.line_values(boards)
+        width = values.shape[2]
+        groups = len(self.groups)
+        counts = np.zeros(len(boards) * groups, dtype=np.float64)
+        board_offsets = (np.arange(len(boards)) * groups)[:, None, None]
+        for length, table in self.columns.items():
+            if length > width:
+                continue
+            codes = np.zeros(values.shape[:2] + (width - length + 1,), dtype=np.int64)
+            for i in range(length):
+                codes = codes * 4 + values[:, :, i:width - length + 1 + i]
+            columns = table[codes]
+            found = columns >= 0
+            counts += np.bincount((columns + board_offsets)[found], minlength=len(counts))
+        counts = counts.reshape(len(boards), groups)
+        fixed = (evaluator.corner_score
+                 + (boards.reshape(len(boards), -1) == AI) @ evaluator.center_bonus
+                 + evaluator.run_penalties(values))
+        return counts, fixed.astype(np.float64)
+
+
+def positions(paths, skip_plies=4):
+    # Yields (board, result) after every move of every game but the last:
+    # the board from the point of view of the player who just moved (AI =
+    # that player), the result 1 if that player won, 0 if lost, 0.5 drawn
+    for path in paths:
+        for size, result, moves in read_games(path):
+            boards = {'X': np.zeros((size, size), dtype=np.int8), 'O': np.zeros((size, size), dtype=np.int8)}
+            for ply, (row, col) in enumerate(moves[:-1]):
+                player = 'XO'[ply % 2]
+                boards[player][row, col] = AI
+                boards['O' if player == 'X' else 'X'][row, col] = HUMAN
+                if ply >= skip_plies:
+                    sign = 1 if player == 'X' else -1
+                    yield boards[player], (1 + sign * result) / 2
+
+
+def feature_chunks(features, paths, chunk_size=4096, skip_plies=4):
+    # Yields (counts, fixed, results) for up to chunk_size positions at a
+    # time, positions of each board size collected apart
+    pending = {}   # size -> (boards, results)
+    for board, result in positions(paths, skip_plies):
+        boards, results = pending.setdefault(len(board), ([], []))
+        boards.append(board.copy())
+        results.append(result)
+        if len(boards) == chunk_size:
+            del pending[len(board)]
+            yield features.features(np.array(boards)) + (np.array(results),)
+    for boards, results in pending.values():
+        yield features.features(np.array(boards)) + (np.array(results),)
+
+
+def fit_scale(features, weights, paths, chunk_size, skip_plies, scales=None):
+    # Texel's K: the scale s of sigmoid(eval / s) that best predicts the
+    # results with the current weights, tried for every scale in one pass
+    scales = np.geomspace(1e3, 1e7, 41) if scales is None else scales
+    errors = np.zeros(len(scales))
+    count = 0
+    for counts, fixed, results in feature_chunks(features, paths, chunk_size, skip_plies):
+        scores = np.clip(fixed + counts @ weights, -1e7, 1e7)
+        predicted = 1 / (1 + np.exp(-scores[None, :] / scales[:, None]))
+        errors += ((predicted - results[None, :]) ** 2).sum(axis=1)
+        count += len(results)
+    best = int(np.argmin(errors))
+    return scales[best], errors[best] / max(count, 1), count
+
+
+def tune(paths, game=None, epochs=10, learning_rate=0.05, chunk_size=4096, skip_plies=4, log=sys.stderr):
+    """Fits the pattern weights of `game` (a default Gomoku if None) to the
+    results of the games in `paths` and returns the new pattern_scores.
+    Adam steps on the mean squared error of sigmoid(eval / scale), one per
+    chunk; the step size is relative to each weight's starting size."""
+    game = game or Gomoku()
+    features = PatternFeatures(game)
+    weights = features.weights(game.pattern_scores)
+    scale, error, count = fit_scale(features, weights, paths, chunk_size, skip_plies)
+    print(f"{count} positions, scale {scale:.0f}, error {error:.5f}", file=log)
+    if not count:
+        return dict(game.pattern_scores)
+    # weights are optimised in units of their starting magnitude
+    unit = np.maximum(np.abs(weights), 1000.0)
+    m = np.zeros_like(weights)
+    v = np.zeros_like(weights)
+    beta1, beta2, step = 0.9, 0.999, 0
+    for epoch in range(epochs):
+        start = time.time()
+        total = 0.0
+        for counts, fixed, results in feature_chunks(features, paths, chunk_size, skip_plies):
+            scores = np.clip(fixed + counts @ weights, -1e7, 1e7)
+            predicted = 1 / (1 + np.exp(-scores / scale))
+            total += ((predicted - results) ** 2).sum()
+            # d error / d weight, per unit of the weight's size
+            slope = 2 * (predicted - results) * predicted * (1 - predicted) / scale
+            gradient = (slope @ counts) / len(results) * unit
+            step += 1
+            m = beta1 * m + (1 - beta1) * gradient
+            v = beta2 * v + (1 - beta2) * gradient ** 2
+            m_hat = m / (1 - beta1 ** step)
+            v_hat = v / (1 - beta2 ** step)
+            weights = weights - learning_rate * unit * m_hat / (np.sqrt(v_hat) + 1e-12)
+        print(f"epoch {epoch + 1}: error {total / count:.5f} ({time.time() - start:.1f}s)", file=log)
+    scores = dict(game.pattern_scores)
+    scores.update(features.pattern_scores(weights))
+    return scores
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Self-play records and Texel tuning of pattern_scores")
+    commands = parser.add_subparsers(dest='command', required=True)
+    play = commands.add_parser('selfplay', help="play engine games and append them to a record file")
+    play.add_argument('path')
+    play.add_argument('--games', type=int, default=100)
+    play.add_argument('--size', type=int, default=15)
+    play.add_argument('--time-limit', type=float, default=0.2, help="seconds per move")
+    play.add_argument('--opening-plies', type=int, default=4, help="random stones before the engines play")
+    play.add_argument('--workers', type=int, default=1)
+    play.add_argument('--seed', type=int, default=None)
+    fit = commands.add_parser('tune', help="fit pattern_scores to the results in record files")
+    fit.add_argument('paths', nargs='+')
+    fit.add_argument('--epochs', type=int, default=10)
+    fit.add_argument('--learning-rate', type=float, default=0.05)
+    fit.add_argument('--chunk-size', type=int, default=4096, help="positions per feature matrix")
+    fit.add_argument('--skip-plies', type=int, default=4, help="opening plies left out of the fit")
+    fit.add_argument('--weights', help="start from these weights instead of the built-in ones")
+    fit.add_argument('--out', default='weights.json')
+    args = parser.parse_args()
+    if args.command == 'selfplay':
+        if not 5 <= args.size <= MAX_SIZE:
+            parser.error(f"--size must be between 5 and {MAX_SIZE}")
+        self_play(args.path, args.games, args.size, args.time_limit, args.opening_plies, args.workers, args.seed)
+    else:
+        start_game = Gomoku()
+        if args.weights:
+            start_game.load_pattern_scores(args.weights)
+        tuned = tune(args.paths, start_game, args.epochs, args.learning_rate, args.chunk_size, args.skip_plies)
+        with open(args.out, 'w') as f:
+            json.dump(tuned, f, indent=2)
+        print(f"wrote {args.out}")
@@ -0,0 +1,123 @@
+# Checks of the fast evaluation paths against their slow references:
+#
+#   python -m pytest -q
+import random
+
+import pytest
+
+from Gomoku import Gomoku
+
+
+def random_game(size, stones, seed, **options):
+    # A Gomoku with `stones` random stones (X and O taking turns) and no
+    # five in a row anywhere, so evaluate_board scores the patterns
+    rng = random.Random(seed)
+    game = Gomoku(size=size, **options)
+    cells = [(row, col) for row in range(size) for col in range(size)]
+    rng.shuffle(cells)
+    player = 'X'
+    for row, col in cells:
+        if game.stone_count >= stones:
+            break
+        if game.is_winning_move(row, col, player):
+            continue
+        game.make_move(row, col, player)
+        player = 'O' if player == 'X' else 'X'
+    return game
+
+
+def regex_total(game):
+    # evaluate_board worked out from scratch with the regex scorer
+    center = sum(game.center_bonus[row][col] for row, col, _ in game.move_history
+                 if game.board[row][col] == game.ai_player1)
+    lines = sum(game.score_line_regex(game.line_string(i)) for i in range(len(game.lines)))
+    return game.corner_score + center + lines
+
+
+@pytest.mark.parametrize('size', [7, 9, 15, 19])
+@pytest.mark.parametrize('seed', range(6))
+@pytest.mark.parametrize('ai_player', ['O', 'X'])
+def test_pattern_tables_match_regex(size, seed, ai_player):
+    game = random_game(size, random.Random(seed).randint(4, size * size // 2), seed, ai_player=ai_player)
+    for i in range(len(game.lines)):
+        assert game.score_line(i) == game.score_line_regex(game.line_string(i)), game.line_string(i)
+    assert game.evaluate_board() == regex_total(game)
+
+
+def test_undo_out_of_order_keeps_winner():
+    game = Gomoku()
+    for col in range(5):
+        game.make_move(7, col, 'X')
+    game.make_move(0, 0, 'O')
+    game.make_move(0, 1, 'O')
+    game.undo_move(7, 2)
+    assert game.winner is None
+    game.undo_move(0, 1)
+    assert game.winner is None
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_random_undo_matches_scan(seed):
+    # Stones taken back in any order: the cached winner stays right
+    rng = random.Random(seed)
+    game = Gomoku(size=9)
+    player = 'X'
+    for _ in range(200):
+        stones = [(row, col) for row, col, _ in game.move_history]
+        if stones and rng.random() < 0.4:
+            row, col = rng.choice(stones)
+            game.undo_move(row, col)
+        else:
+            row, col = rng.randrange(9), rng.randrange(9)
+            game.make_move(row, col, player)
+            player = 'O' if player == 'X' else 'X'
+        assert game.winner == game.scan_winner()
+
+
+@pytest.mark.parametrize('size', [7, 9, 15])
+@pytest.mark.parametrize('seed', range(4))
+@pytest.mark.parametrize('ai_player', ['O', 'X'])
+def test_batch_evaluate_matches_evaluate_board(size, seed, ai_player):
+    batch_eval = pytest.importorskip('gomoku_batch_eval')
+    games = [random_game(size, random.Random(seed * 10 + i).randint(0, size * size // 2), seed * 10 + i,
+                         ai_player=ai_player, sparse=False) for i in range(5)]
+    evaluator = batch_eval.BatchEvaluator(games[0])
+    boards = batch_eval.boards_to_array([game.board for game in games], ai_player, games[0].human_player)
+    assert list(evaluator.evaluate(boards)) == [game.evaluate_board() for game in games]
+
+
+@pytest.mark.parametrize('size', [7, 15])
+@pytest.mark.parametrize('seed', range(4))
+def test_batch_children_match_evaluate_board(size, seed):
+    # Every empty cell for both players, so some children are wins
+    batch_eval = pytest.importorskip('gomoku_batch_eval')
+    game = random_game(size, random.Random(seed).randint(8, size * size // 2), seed, sparse=False)
+    evaluator = batch_eval.BatchEvaluator(game)
+    moves = game.available_moves()
+    for player in ('X', 'O'):
+        expected = []
+        for row, col in moves:
+            game.make_move(row, col, player)
+            expected.append(game.evaluate_board())
+            game.undo_move(row, col)
+        assert list(evaluator.evaluate_children(game, moves, player)) == expected
+
+
+@pytest.mark.parametrize('seed', range(6))
+@pytest.mark.parametrize('ai_player', ['O', 'X'])
+def test_batch_record_matches_evaluate_board(seed, ai_player):
+    # A random game played to a five (or a full board), scored after each ply
+    batch_eval = pytest.importorskip('gomoku_batch_eval')
+    rng = random.Random(seed)
+    game = Gomoku(ai_player=ai_player, size=9, sparse=False)
+    cells = [(row, col) for row in range(9) for col in range(9)]
+    rng.shuffle(cells)
+    moves, expected = [], []
+    for ply, (row, col) in enumerate(cells):
+        game.make_move(row, col, 'XO'[ply % 2])
+        moves.append((row, col))
+        expected.append(game.evaluate_board())
+        if game.game_over():
+            break
+    evaluator = batch_eval.BatchEvaluator(game)
+    assert list(evaluator.evaluate_record(moves, 'X', ai_player)) == expected